@@ -3,14 +3,88 @@
 Created on 28/10/2024 at 16:19:47(+00:00).
 """
 
+import asyncio
 import multiprocessing
 import os
+import signal
+import sys
 import typing as t
+from time import monotonic
 
 from django.core.asgi import get_asgi_application
 from django.core.wsgi import get_wsgi_application
 from django.core.management import call_command
 from gunicorn.app.base import BaseApplication  # type: ignore[import-untyped]
+from gunicorn.arbiter import Arbiter  # type: ignore[import-untyped]
+from gunicorn.workers.base import Worker  # type: ignore[import-untyped]
+from uvicorn_worker import UvicornWorker
+
+from cfl.drain import (
+    finish_worker,
+    get_draining_duration,
+    is_draining,
+    start_draining,
+    start_stopping,
+)
+from cfl.recycling import WorkerRecycler
+
+
+class StandaloneArbiter(Arbiter):
+    """An arbiter which recycles its workers and drains them on SIGTERM."""
+
+    app: "StandaloneApplication"
+
+    def handle_term(self):
+        if is_draining():
+            return
+
+        start_draining()
+        self.log.info(
+            "Draining: reporting shuttingDown for %.1fs before stopping workers.",
+            self.app.drain_deregistration_delay,
+        )
+
+    def manage_workers(self):
+        super().manage_workers()
+
+        if not is_draining():
+            self.app.worker_recycler.recycle_workers(self)
+        elif get_draining_duration() >= self.app.drain_deregistration_delay:
+            self.log.info(
+                "Draining: deregistration delay passed after %.1fs.",
+                get_draining_duration(),
+            )
+            # Stop the arbiter, as Arbiter.handle_term does.
+            raise StopIteration
+
+    def stop(self, graceful=True):
+        start_stopping()
+        stopping_started_at = monotonic()
+        super().stop(graceful)
+        self.log.info("Stopped workers in %.1fs.", monotonic() - stopping_started_at)
+        if is_draining():
+            self.log.info("Drained in %.1fs.", get_draining_duration())
+
+
+class StandaloneWorker(UvicornWorker):
+    """A worker which finishes its running jobs before exiting."""
+
+    def init_process(self):
+        # UvicornWorker sets up the event loop with Config.setup_event_loop,
+        # which Uvicorn 0.36 replaced with Config.get_loop_factory. The loop
+        # is created in run() instead.
+        Worker.init_process(self)
+
+    def init_signals(self):
+        super().init_signals()
+        # Uvicorn raises SIGTERM again once it has finished its in-flight
+        # requests, which would kill the worker before it finishes.
+        signal.signal(signal.SIGTERM, self.handle_exit)
+
+    def run(self):
+        with asyncio.Runner(loop_factory=self.config.get_loop_factory()) as runner:
+            runner.run(self._serve())
+        finish_worker(self)
 
 
 # pylint: disable-next=abstract-method
@@ -23,15 +97,50 @@ class StandaloneApplication(BaseApplication):
     """
 
     def __init__(
-        self, app: t.Callable, workers: int = int(os.getenv("WORKERS", "0"))
+        self,
+        app: t.Callable,
+        workers: int = int(os.getenv("WORKERS", "0")),
+        worker_max_rss: int = int(os.getenv("WORKER_MAX_RSS", "512")),
+        worker_max_requests: int = int(os.getenv("WORKER_MAX_REQUESTS", "10000")),
+        worker_max_requests_jitter: int = int(
+            os.getenv("WORKER_MAX_REQUESTS_JITTER", "1000")
+        ),
+        worker_max_recycling_share: float = float(
+            os.getenv("WORKER_MAX_RECYCLING_SHARE", "0.25")
+        ),
+        drain_deregistration_delay: float = float(
+            os.getenv("DRAIN_DEREGISTRATION_DELAY", "15")
+        ),
+        graceful_timeout: int = int(os.getenv("GRACEFUL_TIMEOUT", "30")),
     ):
         call_command("migrate", interactive=False)
 
+        # https://docs.gunicorn.org/en/stable/design.html#how-many-workers
+        workers = workers or (multiprocessing.cpu_count() * 2) + 1
+        # Workers are recycled by the arbiter instead of Gunicorn's max_requests
+        # so the number recycling at once can be bounded.
+        self.worker_recycler = WorkerRecycler(
+            workers=workers,
+            max_rss=worker_max_rss,
+            max_requests=worker_max_requests,
+            max_requests_jitter=worker_max_requests_jitter,
+            max_recycling_share=worker_max_recycling_share,
+        )
+
+        # The number of seconds to keep serving after SIGTERM, while the load
+        # balancer deregisters the service. See cfl.drain.
+        self.drain_deregistration_delay = drain_deregistration_delay
+
         self.options = {
             "bind": "0.0.0.0:8080",
-            # https://docs.gunicorn.org/en/stable/design.html#how-many-workers
-            "workers": workers or (multiprocessing.cpu_count() * 2) + 1,
-            "worker_class": "uvicorn.workers.UvicornWorker",
+            "workers": workers,
+            "worker_class": StandaloneWorker,
+            "pre_fork": self.worker_recycler.pre_fork,
+            "post_fork": self.worker_recycler.post_fork,
+            "child_exit": self.worker_recycler.child_exit,
+            # The max number of seconds to wait for workers to finish their
+            # in-flight requests and running jobs.
+            "graceful_timeout": graceful_timeout,
         }
         self.application = app
         super().__init__()
@@ -48,6 +157,13 @@ class StandaloneApplication(BaseApplication):
     def load(self):
         return self.application
 
+    def run(self):
+        try:
+            StandaloneArbiter(self).run()
+        except RuntimeError as ex:
+            print(f"\nError: {ex}\n", file=sys.stderr)
+            sys.stderr.flush()
+            sys.exit(1)
 
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
@@ -0,0 +1,30 @@
+from django.apps import AppConfig
+from django.core.signals import request_finished, request_started
+from django.db.backends.signals import connection_created
+
+
+class CflConfig(AppConfig):
+    """The app for this service's own models, signals and commands."""
+
+    name = "cfl"
+
+    def ready(self):
+        # pylint: disable=import-outside-toplevel
+        from cfl.dotdigital import patch_mail
+        from cfl.dotmailer import patch_emails
+        from cfl.jobs import start_job_worker_pool
+        from cfl.middleware.admission_control import stamp_request
+        from cfl.recaptcha import patch_recaptcha
+        from cfl.recycling import count_request
+        from cfl.refresh import recycle_connections, stamp_connection, start_refresher
+
+        request_started.connect(stamp_request)
+        request_started.connect(start_refresher)
+        request_started.connect(start_job_worker_pool)
+        request_finished.connect(recycle_connections)
+        request_finished.connect(count_request)
+        connection_created.connect(stamp_connection)
+
+        patch_emails()
+        patch_mail()
+        patch_recaptcha()
@@ -0,0 +1,106 @@
+"""Calls to the Dotdigital API with the shared, pooled HTTP client.
+
+`common.mail.send_dotdigital_email` opens a new connection to send each
+triggered email, which adds a TLS handshake to requests which send verification
+and notification emails. `patch_mail` replaces it with a version which uses the
+dotdigital integration's client. See cfl.http.
+"""
+
+import typing as t
+
+from django.conf import settings
+
+from cfl.http import get_client
+from cfl.patching import replace_function
+
+if t.TYPE_CHECKING:
+    from common.mail import EmailAttachment
+
+
+# pylint: disable-next=too-many-arguments
+def send_dotdigital_email(
+    campaign_id: int,
+    to_addresses: t.List[str],
+    cc_addresses: t.Optional[t.List[str]] = None,
+    bcc_addresses: t.Optional[t.List[str]] = None,
+    from_address: t.Optional[str] = None,
+    personalization_values: t.Optional[t.Dict[str, str]] = None,
+    metadata: t.Optional[str] = None,
+    attachments: t.Optional[t.List["EmailAttachment"]] = None,
+    region: str = "r1",
+    auth: t.Optional[str] = None,
+    timeout: t.Optional[int] = None,
+):
+    """Send a triggered email campaign using Dotdigital's API.
+
+    Takes the same arguments as `common.mail.send_dotdigital_email`, except
+    that the timeout defaults to the integration's.
+
+    Raises:
+        AssertionError: If failed to send email.
+    """
+    # Dotdigital emails don't work locally, so send a dummy email with Django.
+    if settings.ENV == "local":
+        # pylint: disable-next=import-outside-toplevel
+        from common.mail import django_send_email
+
+        django_send_email(
+            from_address,
+            to_addresses,
+            "dummy_subject",
+            "dummy_text_content",
+            "dummy_title",
+        )
+        return
+
+    body: t.Dict[str, t.Any] = {
+        "campaignId": campaign_id,
+        "toAddresses": to_addresses,
+    }
+    if cc_addresses is not None:
+        body["ccAddresses"] = cc_addresses
+    if bcc_addresses is not None:
+        body["bccAddresses"] = bcc_addresses
+    if from_address is not None:
+        body["fromAddress"] = from_address
+    if personalization_values is not None:
+        body["personalizationValues"] = [
+            {"name": key, "value": value}
+            for key, value in personalization_values.items()
+        ]
+    if metadata is not None:
+        body["metadata"] = metadata
+    if attachments is not None:
+        body["attachments"] = [
+            {
+                "fileName": attachment.file_name,
+                "mimeType": attachment.mime_type,
+                "content": attachment.content,
+            }
+            for attachment in attachments
+        ]
+
+    response = get_client("dotdigital").request(
+        "POST",
+        f"https://{region}-api.dotdigital.com/v2/email/triggered-campaign",
+        json=body,
+        headers={
+            "accept": "text/plain",
+            "authorization": auth or settings.DOTDIGITAL_AUTH,
+        },
+        **({} if timeout is None else {"timeout": timeout}),
+    )
+
+    assert response.is_success, (
+        "Failed to send email."
+        f" Reason: {response.reason_phrase}."
+        f" Text: {response.text}."
+    )
+
+
+def patch_mail():
+    """Replace `common.mail.send_dotdigital_email`."""
+    # pylint: disable-next=import-outside-toplevel
+    from common import mail
+
+    replace_function(mail.send_dotdigital_email, send_dotdigital_email)
@@ -0,0 +1,308 @@
+"""Calls to the Dotmailer API, moved out of the request path.
+
+The helpers in `common.helpers.emails` call Dotmailer inline, so its latency is
+added to signup, newsletter and account-deletion requests. `patch_emails`
+replaces them with versions which enqueue background jobs instead. Additions to
+the same address book and sends of the same campaign are batched into bulk
+calls. Contacts are still looked up inline, as the newsletter consent form needs
+them, but with the pooled client.
+"""
+
+import csv
+import typing as t
+from io import StringIO
+
+import httpx
+from django.conf import settings
+from django.utils import timezone
+
+from cfl.http import get_client
+from cfl.jobs import Payload, PermanentJobError, enqueue, register
+from cfl.patching import replace_function
+
+ADDRESS_BOOK_URL = "https://r1-api.dotmailer.com/v2/address-books/{}/contacts"
+
+# The max number of contacts to import into an address book at once.
+IMPORT_BATCH_SIZE = 100
+# The max number of contacts to send a campaign to at once.
+CAMPAIGN_BATCH_SIZE = 100
+# The client errors which may not be returned again if retried.
+RETRYABLE_CLIENT_ERRORS = (408, 409, 425, 429)
+
+
+def check_response(response: httpx.Response):
+    """Raise an error if a response from the Dotmailer API is unsuccessful.
+
+    Raises:
+        PermanentJobError: The request was rejected and would be again.
+        httpx.HTTPStatusError: The request failed and should be retried.
+    """
+    try:
+        response.raise_for_status()
+    except httpx.HTTPStatusError as ex:
+        if (
+            response.is_client_error
+            and response.status_code not in RETRYABLE_CLIENT_ERRORS
+        ):
+            raise PermanentJobError(str(ex)) from ex
+        raise
+
+
+def request(method: str, url: str, raise_for_status: bool = True, **kwargs):
+    """Make an authenticated request to the Dotmailer API."""
+    response = get_client("dotmailer").request(
+        method,
+        url,
+        auth=(settings.DOTMAILER_USER, settings.DOTMAILER_PASSWORD),
+        **kwargs,
+    )
+    if raise_for_status:
+        check_response(response)
+    return response
+
+
+def get_data_fields(first_name: str, last_name: str):
+    """Get the data fields of a contact."""
+    return [
+        {"key": "FIRSTNAME", "value": first_name},
+        {"key": "LASTNAME", "value": last_name},
+        {"key": "FULLNAME", "value": f"{first_name} {last_name}"},
+    ]
+
+
+@register("dotmailer.create_contact")
+def run_create_contact(payloads: t.List[Payload]):
+    """Create a contact with their consent and default preferences."""
+    (payload,) = payloads
+    request(
+        "POST",
+        settings.DOTMAILER_CREATE_CONTACT_URL,
+        json={
+            "contact": {
+                "email": payload["email"],
+                "optInType": "VerifiedDouble",
+                "emailType": "Html",
+                "dataFields": get_data_fields(
+                    payload["first_name"], payload["last_name"]
+                ),
+            },
+            "consentFields": [
+                {
+                    "fields": [
+                        {
+                            "key": "DATETIMECONSENTED",
+                            "value": payload["consented_at"],
+                        }
+                    ]
+                }
+            ],
+            "preferences": settings.DOTMAILER_DEFAULT_PREFERENCES,
+        },
+    )
+
+
+@register("dotmailer.add_contact_to_address_book", batch_size=IMPORT_BATCH_SIZE)
+def run_add_contacts_to_address_book(payloads: t.List[Payload]):
+    """Add contacts to an address book with a single bulk import."""
+    contacts = StringIO()
+    writer = csv.writer(contacts)
+    writer.writerow(
+        ["Email", "OptInType", "EmailType", "FIRSTNAME", "LASTNAME", "FULLNAME"]
+    )
+    for payload in payloads:
+        first_name, last_name = payload["first_name"], payload["last_name"]
+        writer.writerow(
+            [
+                payload["email"],
+                "VerifiedDouble",
+                "Html",
+                first_name,
+                last_name,
+                f"{first_name} {last_name}",
+            ]
+        )
+
+    # All payloads in a batch have the same address book.
+    request(
+        "POST",
+        f"{payloads[0]['address_book_url']}/import",
+        files={"file": ("contacts.csv", contacts.getvalue(), "text/csv")},
+    )
+
+
+@register("dotmailer.delete_contact")
+def run_delete_contact(payloads: t.List[Payload]):
+    """Delete a contact, if they exist."""
+    (payload,) = payloads
+    response = request(
+        "GET",
+        settings.DOTMAILER_GET_USER_BY_EMAIL_URL.replace("EMAIL", payload["email"]),
+        raise_for_status=False,
+    )
+    # Most users are not contacts, so there's nothing to delete.
+    if response.status_code == 404:
+        return
+    check_response(response)
+
+    contact_id = response.json().get("id")
+    if contact_id:
+        response = request(
+            "DELETE",
+            settings.DOTMAILER_DELETE_USER_BY_ID_URL.replace("ID", str(contact_id)),
+            raise_for_status=False,
+        )
+        if response.status_code != 404:
+            check_response(response)
+
+
+@register("dotmailer.add_consent_record")
+def run_add_consent_record(payloads: t.List[Payload]):
+    """Record that a contact consented again."""
+    (payload,) = payloads
+    contact = payload["contact"]
+    request(
+        "PUT",
+        settings.DOTMAILER_PUT_CONSENT_DATA_URL.replace("USER_ID", str(contact["id"])),
+        json={
+            "contact": {
+                "email": contact["email"],
+                "optInType": contact["optInType"],
+                "emailType": contact["emailType"],
+                "dataFields": contact["dataFields"],
+            },
+            "consentFields": [
+                {
+                    "fields": [
+                        {
+                            "key": "DATETIMECONSENTED",
+                            "value": payload["consented_at"],
+                        }
+                    ]
+                }
+            ],
+        },
+    )
+
+
+@register("dotmailer.send_campaign", batch_size=CAMPAIGN_BATCH_SIZE)
+def run_send_campaign(payloads: t.List[Payload]):
+    """Send a campaign to contacts with a single call."""
+    # All payloads in a batch have the same campaign.
+    request(
+        "POST",
+        settings.DOTMAILER_SEND_CAMPAIGN_URL,
+        json={
+            "campaignID": payloads[0]["campaign_id"],
+            "contactIds": [str(payload["contact_id"]) for payload in payloads],
+        },
+    )
+
+
+# Replacements for the helpers in common.helpers.emails.
+
+
+def add_to_dotmailer(
+    first_name: str,
+    last_name: str,
+    email: str,
+    address_book_id: int,
+    user_type=None,
+):
+    """Create a contact and add them to the main address book and the address
+    book of their user type.
+    """
+    enqueue(
+        "dotmailer.create_contact",
+        {
+            "first_name": first_name,
+            "last_name": last_name,
+            "email": email,
+            "consented_at": str(timezone.now()),
+        },
+    )
+
+    address_book_urls = [ADDRESS_BOOK_URL.format(address_book_id)]
+    if user_type is not None:
+        address_book_urls.append(
+            {
+                "TEACHER": settings.DOTMAILER_TEACHER_ADDRESS_BOOK_URL,
+                "STUDENT": settings.DOTMAILER_STUDENT_ADDRESS_BOOK_URL,
+            }.get(user_type.name, settings.DOTMAILER_NO_ACCOUNT_ADDRESS_BOOK_URL)
+        )
+
+    for address_book_url in address_book_urls:
+        enqueue(
+            "dotmailer.add_contact_to_address_book",
+            {
+                "first_name": first_name,
+                "last_name": last_name,
+                "email": email,
+                "address_book_url": address_book_url,
+            },
+            batch_key=address_book_url,
+        )
+
+
+def delete_contact(email: str):
+    """Delete a contact."""
+    enqueue("dotmailer.delete_contact", {"email": email})
+
+
+def get_dotmailer_user_by_email(email: str) -> t.Dict[str, t.Any]:
+    """Get a contact by their email.
+
+    If there is no such contact, the error returned by Dotmailer is returned,
+    which has none of a contact's keys.
+    """
+    return request(
+        "GET",
+        settings.DOTMAILER_GET_USER_BY_EMAIL_URL.replace("EMAIL", email),
+        raise_for_status=False,
+    ).json()
+
+
+def add_consent_record_to_dotmailer_user(user: t.Dict[str, t.Any]):
+    """Record that a contact consented again.
+
+    Raises:
+        KeyError: The user is not a contact. The consent form expects this.
+    """
+    contact = {
+        "id": user["id"],
+        "email": user["email"],
+        "optInType": user["optInType"],
+        "emailType": user["emailType"],
+        "dataFields": user["dataFields"],
+    }
+    enqueue(
+        "dotmailer.add_consent_record",
+        {"contact": contact, "consented_at": str(timezone.now())},
+    )
+
+
+def send_dotmailer_consent_confirmation_email_to_user(user: t.Dict[str, t.Any]):
+    """Thank a contact for staying."""
+    campaign_id = settings.DOTMAILER_THANKS_FOR_STAYING_CAMPAIGN_ID
+    enqueue(
+        "dotmailer.send_campaign",
+        {"campaign_id": campaign_id, "contact_id": user["id"]},
+        batch_key=str(campaign_id),
+    )
+
+
+REPLACEMENTS = (
+    add_to_dotmailer,
+    delete_contact,
+    get_dotmailer_user_by_email,
+    add_consent_record_to_dotmailer_user,
+    send_dotmailer_consent_confirmation_email_to_user,
+)
+
+
+def patch_emails():
+    """Replace the Dotmailer helpers in common.helpers.emails."""
+    # pylint: disable-next=import-outside-toplevel
+    from common.helpers import emails
+
+    for replacement in REPLACEMENTS:
+        replace_function(getattr(emails, replacement.__name__), replacement)
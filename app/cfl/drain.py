@@ -0,0 +1,87 @@
+"""Graceful draining of the service when it's told to shut down.
+
+On SIGTERM, the Gunicorn arbiter drains the service in phases instead of
+stopping its workers straight away, which would drop requests the load balancer
+is still routing to them:
+
+1. The health check of every worker reports "shuttingDown" so the load balancer
+   deregisters the service.
+2. The workers keep serving for the deregistration delay, while the load
+   balancer stops routing requests to them.
+3. The workers are sent SIGTERM, so they stop accepting connections and finish
+   their in-flight requests. Then they finish the jobs their background job
+   threads are running.
+4. The workers exit, followed by the arbiter.
+
+The timing of each phase is logged. The drain state is kept in memory shared
+by the arbiter and its workers, so this module must be imported before the
+workers are forked.
+"""
+
+import ctypes
+import multiprocessing
+from time import monotonic, time
+
+# When draining and stopping the workers started, as UNIX timestamps. 0 if not.
+_draining_started_at = multiprocessing.RawValue(ctypes.c_double, 0)
+_stopping_started_at = multiprocessing.RawValue(ctypes.c_double, 0)
+
+
+def start_draining():
+    """Start draining the service. Called in the arbiter."""
+    _draining_started_at.value = time()
+
+
+def start_stopping():
+    """Record that the workers are being stopped. Called in the arbiter."""
+    _stopping_started_at.value = time()
+
+
+def is_draining():
+    """Whether the service is draining."""
+    return _draining_started_at.value != 0
+
+
+def get_draining_duration():
+    """The number of seconds since draining started."""
+    return time() - _draining_started_at.value
+
+
+def finish_worker(worker):
+    """Finish a worker's running jobs before it exits.
+
+    Called in the worker once it has finished its in-flight requests. The
+    worker keeps notifying the arbiter while it waits, so the arbiter doesn't
+    kill it for timing out.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from cfl.jobs import job_worker_pool
+
+    if _stopping_started_at.value:
+        worker.log.info(
+            "Worker (pid: %s) finished its in-flight requests in %.1fs.",
+            worker.pid,
+            time() - _stopping_started_at.value,
+        )
+
+    started_at = monotonic()
+    deadline = started_at + worker.cfg.graceful_timeout
+    while True:
+        worker.notify()
+        # Gunicorn's workers notify the arbiter every worker.timeout seconds.
+        timeout = min(deadline - monotonic(), worker.timeout or 1)
+        finished = job_worker_pool.stop(timeout=max(timeout, 0))
+        if finished or monotonic() >= deadline:
+            break
+
+    if finished:
+        worker.log.info(
+            "Worker (pid: %s) finished its running jobs in %.1fs.",
+            worker.pid,
+            monotonic() - started_at,
+        )
+    else:
+        worker.log.warning(
+            "Worker (pid: %s) timed out finishing its running jobs.",
+            worker.pid,
+        )
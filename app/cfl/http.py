@@ -0,0 +1,262 @@
+"""Shared, pooled HTTP clients for outbound integrations.
+
+Each worker process has one client per integration, which keeps connections to
+the integration's hosts alive between calls instead of setting up a new TLS
+connection each time, and uses HTTP/2 where the h2 package is installed and the
+host supports it. Each integration has its own timeout and circuit breaker and
+records its latency and errors, which are reported by the health check.
+
+Examples:
+    ```
+    client = get_client("dotmailer")
+    response = client.request("GET", url)
+    response = await client.arequest("GET", url)
+    ```
+"""
+
+import logging
+import os
+import threading
+import typing as t
+from dataclasses import dataclass, field
+from importlib.util import find_spec
+from time import monotonic
+
+import httpx
+from django.conf import settings
+
+CircuitState = t.Literal["closed", "open", "halfOpen"]
+
+
+@dataclass(frozen=True)
+class Integration:
+    """The configuration of an outbound integration."""
+
+    name: str
+    # The number of seconds to wait for a response.
+    timeout: float = 10
+    # The number of consecutive failures after which the circuit opens.
+    failure_threshold: int = 5
+    # The number of seconds after which an open circuit lets a request through.
+    reset_timeout: float = 30
+    max_connections: int = 10
+    # The number of seconds to keep idle connections alive.
+    keepalive_expiry: float = 60
+
+
+class CircuitOpenError(Exception):
+    """The circuit of an integration is open so requests are not sent."""
+
+
+@dataclass
+class CircuitBreaker:
+    """Stops sending requests to an integration which keeps failing."""
+
+    failure_threshold: int
+    reset_timeout: float
+    state: CircuitState = "closed"
+    failures: int = 0
+    opened_at: float = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def allow(self):
+        """Whether a request may be sent.
+
+        Once the reset timeout has passed, a single request is let through to
+        probe whether the integration has recovered. Other requests are
+        rejected until the probe's result is recorded.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return True
+
+            if (
+                self.state == "open"
+                and monotonic() - self.opened_at >= self.reset_timeout
+            ):
+                self.state = "halfOpen"
+                return True
+
+            return False
+
+    def record_success(self):
+        """Record that a request succeeded, closing the circuit."""
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        """Record that a request failed, opening the circuit if needed."""
+        with self._lock:
+            self.failures += 1
+            if self.state == "halfOpen" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = monotonic()
+
+
+@dataclass
+class Metrics:
+    """The latency and errors of an integration's requests."""
+
+    requests: int = 0
+    errors: int = 0
+    rejected: int = 0
+    # The total and max number of seconds the requests took.
+    total_latency: float = 0
+    max_latency: float = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def average_latency(self):
+        """The average number of seconds the requests took."""
+        return self.total_latency / self.requests if self.requests else 0
+
+    def record(self, latency: float, error: bool):
+        """Record a request which was sent."""
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def record_rejected(self):
+        """Record a request which was not sent as the circuit was open."""
+        with self._lock:
+            self.rejected += 1
+
+
+class IntegrationClient:
+    """A pooled HTTP client for an integration, with sync and async interfaces.
+
+    Responses with a 5xx status count as failures. Other statuses are left to
+    the caller to handle.
+    """
+
+    def __init__(self, integration: Integration):
+        self.integration = integration
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=integration.failure_threshold,
+            reset_timeout=integration.reset_timeout,
+        )
+        self.metrics = Metrics()
+        self._lock = threading.Lock()
+        self._pid: t.Optional[int] = None
+        self._client: t.Optional[httpx.Client] = None
+        self._async_client: t.Optional[httpx.AsyncClient] = None
+
+    def _get_client_kwargs(self):
+        return {
+            "http2": find_spec("h2") is not None,
+            "timeout": self.integration.timeout,
+            "limits": httpx.Limits(
+                max_connections=self.integration.max_connections,
+                max_keepalive_connections=self.integration.max_connections,
+                keepalive_expiry=self.integration.keepalive_expiry,
+            ),
+        }
+
+    def _reset_after_fork(self):
+        # Connections must not be shared with forked processes.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._client = None
+            self._async_client = None
+
+    @property
+    def client(self):
+        """The sync client of this process."""
+        with self._lock:
+            self._reset_after_fork()
+            if self._client is None:
+                self._client = httpx.Client(**self._get_client_kwargs())
+
+            return self._client
+
+    @property
+    def async_client(self):
+        """The async client of this process."""
+        with self._lock:
+            self._reset_after_fork()
+            if self._async_client is None:
+                self._async_client = httpx.AsyncClient(**self._get_client_kwargs())
+
+            return self._async_client
+
+    def _before_request(self):
+        if not self.circuit_breaker.allow():
+            self.metrics.record_rejected()
+            raise CircuitOpenError(f'The circuit of "{self.integration.name}" is open.')
+
+        return monotonic()
+
+    def _after_request(
+        self,
+        start_time: float,
+        response: t.Optional[httpx.Response],
+    ):
+        error = response is None or response.is_server_error
+        self.metrics.record(latency=monotonic() - start_time, error=error)
+        if error:
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+
+    def request(self, method: str, url: str, **kwargs):
+        """Send a request.
+
+        Args:
+            method: The HTTP method.
+            url: The URL to send the request to.
+            **kwargs: Passed to httpx.Client.request.
+
+        Raises:
+            CircuitOpenError: The integration's circuit is open.
+            httpx.HTTPError: The request could not be sent.
+
+        Returns:
+            The response.
+        """
+        start_time = self._before_request()
+        response = None
+        try:
+            response = self.client.request(method, url, **kwargs)
+            return response
+        finally:
+            self._after_request(start_time, response)
+
+    async def arequest(self, method: str, url: str, **kwargs):
+        """Send a request asynchronously. See `request`."""
+        start_time = self._before_request()
+        response = None
+        try:
+            response = await self.async_client.request(method, url, **kwargs)
+            return response
+        finally:
+            self._after_request(start_time, response)
+
+
+_clients: t.Dict[str, IntegrationClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name: str):
+    """Get the client of an integration configured in HTTP_INTEGRATIONS."""
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            integrations: t.Dict[str, t.Dict[str, t.Any]] = getattr(
+                settings, "HTTP_INTEGRATIONS", {}
+            )
+            if name not in integrations:
+                logging.warning('Integration "%s" is not configured.', name)
+
+            client = _clients[name] = IntegrationClient(
+                Integration(name=name, **integrations.get(name, {}))
+            )
+
+        return client
+
+
+def get_clients():
+    """Get the clients of all the configured integrations."""
+    return [get_client(name) for name in getattr(settings, "HTTP_INTEGRATIONS", {})]
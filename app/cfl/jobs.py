@@ -0,0 +1,335 @@
+"""A background job queue backed by a table in the service's database.
+
+Jobs are enqueued in the request's transaction, so they are only run if the
+request succeeds, and are run by a pool of threads in each worker process. So
+no extra service is needed. Jobs are claimed with `SELECT ... FOR UPDATE SKIP
+LOCKED` in a short transaction which leases them for JOBS_LEASE seconds, so each
+job is run by one thread across all workers and no transaction is held open
+while a job calls a third party. If a thread dies while running a job, the job
+is run again once its lease expires.
+
+Jobs of a kind which has a batch size are run together with other pending jobs
+of the same kind and batch key, so that they can be sent in one bulk call.
+Failed jobs are retried with exponential backoff, unless they raise a
+`PermanentJobError`. Attempts are counted when jobs are claimed, so jobs which
+kill their thread or process are given up on too.
+
+Examples:
+    ```
+    @register("greet", batch_size=100)
+    def greet(payloads: t.List[Payload]):
+        send_greetings([payload["name"] for payload in payloads])
+
+    enqueue("greet", {"name": "Alex"})
+    ```
+"""
+
+import logging
+import os
+import random
+import threading
+import typing as t
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from cfl.models import Job
+from cfl.refresh import recycle_connections
+
+Payload = t.Dict[str, t.Any]
+
+
+class PermanentJobError(Exception):
+    """Raised by a job's function if retrying its jobs would fail again."""
+
+
+@dataclass(frozen=True)
+class JobKind:
+    """How to run a kind of job."""
+
+    handle: t.Callable[[t.List[Payload]], None]
+    # The max number of jobs to run together.
+    batch_size: int = 1
+
+
+JOB_KINDS: t.Dict[str, JobKind] = {}
+
+
+def register(kind: str, batch_size: int = 1):
+    """Register a function to run a kind of job.
+
+    The function is called with the payloads of the jobs in a batch and should
+    raise an error if they should be retried, or a `PermanentJobError` if they
+    should be given up on.
+
+    Args:
+        kind: The kind of job.
+        batch_size: The max number of jobs to run together.
+    """
+
+    def decorator(handle: t.Callable[[t.List[Payload]], None]):
+        JOB_KINDS[kind] = JobKind(handle=handle, batch_size=batch_size)
+        return handle
+
+    return decorator
+
+
+def enqueue(kind: str, payload: Payload, batch_key: str = ""):
+    """Enqueue a job to run in the background.
+
+    Args:
+        kind: The kind of job.
+        payload: The JSON-serializable data to run the job with.
+        batch_key: Jobs of the same kind with the same batch key can be run
+            together.
+    """
+    job = Job.objects.create(kind=kind, payload=payload, batch_key=batch_key)
+    transaction.on_commit(job_worker_pool.wake)
+    return job
+
+
+def get_retry_delay(attempts: int):
+    """Get how long to wait before retrying a job, with exponential backoff."""
+    delay = min(2**attempts * 10, 60 * 60)
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def close_unusable_connection():
+    """Close this thread's connection if it has broken.
+
+    Unlike `close_old_connections`, the connection is otherwise kept open
+    between polls, as CONN_MAX_AGE is 0.
+    """
+    if connection.connection is not None and connection.errors_occurred:
+        if connection.is_usable():
+            connection.errors_occurred = False
+        else:
+            connection.close()
+
+
+def claim_next_batch():
+    """Claim the next batch of pending jobs by leasing them to this thread.
+
+    Returns:
+        The claimed jobs, which are empty if there were none to run.
+    """
+    now = timezone.now()
+    max_attempts = getattr(settings, "JOBS_MAX_ATTEMPTS", 8)
+    pending_jobs = (
+        Job.objects.select_for_update(skip_locked=True)
+        .filter(failed_at__isnull=True, run_after__lte=now)
+        .order_by("run_after", "id")
+    )
+
+    with transaction.atomic():
+        # Jobs whose lease expired after their last attempt never finished it,
+        # e.g. as their process was killed.
+        abandoned_count = Job.objects.filter(
+            failed_at__isnull=True, run_after__lte=now, attempts__gte=max_attempts
+        ).update(failed_at=now, last_error="The last attempt's lease expired.")
+        if abandoned_count:
+            logging.error("Gave up on %d abandoned jobs.", abandoned_count)
+
+        job = pending_jobs.filter(attempts__lt=max_attempts).first()
+        if job is None:
+            return []
+
+        batch = [job]
+        job_kind = JOB_KINDS.get(job.kind)
+        if job_kind and job_kind.batch_size > 1:
+            batch += pending_jobs.filter(
+                kind=job.kind, batch_key=job.batch_key, attempts__lt=max_attempts
+            ).exclude(id=job.id)[: job_kind.batch_size - 1]
+
+        lease = timedelta(seconds=getattr(settings, "JOBS_LEASE", 5 * 60))
+        Job.objects.filter(id__in=[batch_job.id for batch_job in batch]).update(
+            run_after=now + lease, attempts=F("attempts") + 1
+        )
+        for batch_job in batch:
+            batch_job.attempts += 1
+
+    return batch
+
+
+def run_next_batch():
+    """Run the next batch of pending jobs.
+
+    Returns:
+        Whether there were any jobs to run.
+    """
+    close_unusable_connection()
+    recycle_connections()
+
+    batch = claim_next_batch()
+    if not batch:
+        return False
+
+    kind = batch[0].kind
+    try:
+        job_kind = JOB_KINDS.get(kind)
+        if job_kind is None:
+            raise LookupError(f'Job kind "{kind}" is not registered.')
+
+        job_kind.handle([batch_job.payload for batch_job in batch])
+    # pylint: disable-next=broad-exception-caught
+    except Exception as ex:
+        now = timezone.now()
+        max_attempts = getattr(settings, "JOBS_MAX_ATTEMPTS", 8)
+        for batch_job in batch:
+            batch_job.last_error = repr(ex)
+            if batch_job.attempts < max_attempts and not isinstance(
+                ex, PermanentJobError
+            ):
+                batch_job.run_after = now + get_retry_delay(batch_job.attempts)
+            else:
+                batch_job.failed_at = now
+                logging.error("Gave up on job %s: %r", batch_job, ex)
+
+        Job.objects.bulk_update(batch, fields=["last_error", "run_after", "failed_at"])
+        logging.warning("Failed to run %d %s jobs: %r", len(batch), kind, ex)
+    else:
+        Job.objects.filter(id__in=[batch_job.id for batch_job in batch]).delete()
+        oldest_created_at = min(batch_job.created_at for batch_job in batch)
+        logging.info(
+            "Ran %d %s jobs. The oldest was queued for %.1fs.",
+            len(batch),
+            kind,
+            (timezone.now() - oldest_created_at).total_seconds(),
+        )
+
+    return True
+
+
+@dataclass(frozen=True)
+class QueueStats:
+    """The state of the job queue."""
+
+    pending: int
+    failed: int
+    # How long the oldest pending job has been queued for, in seconds.
+    oldest_pending_age: float
+
+
+def get_queue_stats():
+    """Get the state of the job queue."""
+    pending = Q(failed_at__isnull=True)
+    stats = Job.objects.aggregate(
+        pending=Count("id", filter=pending),
+        failed=Count("id", filter=~pending),
+        oldest_pending_created_at=Min("created_at", filter=pending),
+    )
+
+    oldest_pending_created_at = stats["oldest_pending_created_at"]
+    return QueueStats(
+        pending=stats["pending"],
+        failed=stats["failed"],
+        oldest_pending_age=(
+            (timezone.now() - oldest_pending_created_at).total_seconds()
+            if oldest_pending_created_at
+            else 0
+        ),
+    )
+
+
+class JobWorkerPool:
+    """A pool of threads which run jobs in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        # The number of threads running a batch.
+        self._running = 0
+        self._idle = threading.Condition(self._lock)
+        self._pid: t.Optional[int] = None
+
+    def start(self, workers: int, poll_interval: float):
+        """Start the pool in this process, if not already started.
+
+        Threads do not survive forking, so this is safe to call in each request
+        and starts the threads once per worker process.
+
+        Args:
+            workers: The number of threads. 0 disables the pool.
+            poll_interval: The number of seconds to wait for new jobs.
+        """
+        if self._pid == os.getpid() or workers <= 0:
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+
+        for index in range(workers):
+            threading.Thread(
+                target=self.run,
+                args=(poll_interval,),
+                name=f"cfl-jobs-{index}",
+                daemon=True,
+            ).start()
+
+    def wake(self):
+        """Wake the threads to run newly enqueued jobs."""
+        self._wake.set()
+
+    def stop(self, timeout: float):
+        """Stop running jobs in this process.
+
+        Batches which are already running are finished, so their jobs are
+        deleted or their failures recorded.
+
+        Args:
+            timeout: The max number of seconds to wait for running batches.
+
+        Returns:
+            Whether the running batches finished in time.
+        """
+        if self._pid != os.getpid():
+            return True
+
+        self._stopping.set()
+        self._wake.set()
+        with self._idle:
+            return self._idle.wait_for(lambda: self._running == 0, timeout)
+
+    def run(self, poll_interval: float):
+        """Run jobs until the pool is stopped."""
+        while True:
+            with self._lock:
+                if self._stopping.is_set():
+                    return
+                self._running += 1
+
+            try:
+                ran = run_next_batch()
+            # pylint: disable-next=broad-exception-caught
+            except Exception:
+                logging.exception("Failed to run jobs.")
+                ran = False
+            finally:
+                with self._idle:
+                    self._running -= 1
+                    self._idle.notify_all()
+
+            if not ran:
+                self._wake.wait(poll_interval)
+                self._wake.clear()
+
+
+job_worker_pool = JobWorkerPool()
+
+
+def start_job_worker_pool(**kwargs):
+    """Start the job worker pool in this process.
+
+    Receives the `request_started` signal.
+    """
+    job_worker_pool.start(
+        workers=getattr(settings, "JOBS_WORKERS", 0),
+        poll_interval=getattr(settings, "JOBS_POLL_INTERVAL", 1),
+    )
@@ -0,0 +1,494 @@
+"""
+Generate a production-scale synthetic dataset in the local database.
+
+Rows are generated in parallel worker processes and bulk-loaded with Postgres'
+COPY so that millions of rows can be loaded in minutes instead of hours. The
+result can be snapshotted as a template database, so that benchmark runs can be
+reset in seconds.
+
+Examples:
+    ```
+    # Generate the default dataset and snapshot it.
+    python manage.py generate_load_test_data --snapshot codeforlife_load_test
+
+    # Reset the database to the snapshot before each benchmark run.
+    python manage.py generate_load_test_data --restore codeforlife_load_test
+    ```
+"""
+
+import multiprocessing
+import random
+import typing as t
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from io import StringIO
+from time import perf_counter
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, connections
+from django.db.models import Max, Model
+from django.utils import timezone
+
+Row = t.Dict[str, t.Any]
+
+COUNTIES = ("Hertfordshire", "Kent", "Surrey", "Essex", "Yorkshire", "Devon")
+FIRST_NAMES = ("Alex", "Sam", "Jo", "Charlie", "Robin", "Max", "Ali", "Kim")
+LAST_NAMES = ("Smith", "Jones", "Taylor", "Brown", "Patel", "Khan", "Evans")
+
+
+@dataclass(frozen=True)
+class Plan:
+    """What to generate and which primary keys to generate it with.
+
+    Primary keys are offset by the highest existing key in each table, so the
+    dataset can be loaded on top of existing data. Relations are derived from
+    the row indexes, so each worker can generate its chunk independently.
+    """
+
+    schools: int
+    teachers: int
+    classes_per_teacher: int
+    students: int
+    level_metrics: int
+    level_ids: t.Tuple[int, ...]
+    password: str
+    now: datetime
+    seed: int
+    # The highest existing primary key of each table.
+    user_base: int
+    profile_base: int
+    school_base: int
+    teacher_base: int
+    class_base: int
+    student_base: int
+    level_metrics_base: int
+
+    @property
+    def classes(self):
+        """The number of classes to generate."""
+        return self.teachers * self.classes_per_teacher
+
+    @property
+    def users(self):
+        """The number of users to generate. Teachers come before students."""
+        return self.teachers + self.students
+
+
+def _date(plan: Plan, rng: random.Random, max_days: int = 730):
+    return plan.now - timedelta(seconds=rng.randrange(max_days * 24 * 60 * 60))
+
+
+def _name(rng: random.Random):
+    return rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+
+
+def _access_code(class_id: int):
+    # Base 26 is unique for up to 26^5 (~11.8 million) classes.
+    letters = []
+    for _ in range(5):
+        class_id, remainder = divmod(class_id, 26)
+        letters.append(chr(ord("A") + remainder))
+    return "".join(reversed(letters))
+
+
+def _school_row(plan: Plan, index: int, rng: random.Random) -> Row:
+    school_id = plan.school_base + index + 1
+    return {
+        "id": school_id,
+        "name": f"Load Test School {school_id}",
+        "country": "GB",
+        "county": rng.choice(COUNTIES),
+        "creation_time": _date(plan, rng),
+        "is_active": True,
+    }
+
+
+def _user_row(plan: Plan, index: int, rng: random.Random) -> Row:
+    user_id = plan.user_base + index + 1
+    first_name, last_name = _name(rng)
+    if index < plan.teachers:
+        username = email = f"teacher{user_id}@load-test.codeforlife.education"
+    else:
+        username, email = f"load-test-student-{user_id}", ""
+
+    return {
+        "id": user_id,
+        "password": plan.password,
+        "last_login": _date(plan, rng, max_days=30),
+        "is_superuser": False,
+        "username": username,
+        "first_name": first_name,
+        "last_name": last_name,
+        "email": email,
+        "is_staff": False,
+        "is_active": True,
+        "date_joined": _date(plan, rng),
+    }
+
+
+def _profile_row(plan: Plan, index: int, rng: random.Random) -> Row:
+    return {
+        "id": plan.profile_base + index + 1,
+        "user_id": plan.user_base + index + 1,
+        "is_verified": index < plan.teachers or rng.random() < 0.1,
+    }
+
+
+def _teacher_row(plan: Plan, index: int, rng: random.Random) -> Row:
+    return {
+        "id": plan.teacher_base + index + 1,
+        "user_id": plan.profile_base + index + 1,
+        "new_user_id": plan.user_base + index + 1,
+        "school_id": plan.school_base + (index % plan.schools) + 1,
+        # The first teacher of each school is its admin.
+        "is_admin": index < plan.schools,
+    }
+
+
+def _class_row(plan: Plan, index: int, rng: random.Random) -> Row:
+    class_id = plan.class_base + index + 1
+    teacher_id = plan.teacher_base + (index // plan.classes_per_teacher) + 1
+    return {
+        "id": class_id,
+        "name": f"Load Test Class {class_id}",
+        "teacher_id": teacher_id,
+        "access_code": _access_code(class_id),
+        "classmates_data_viewable": rng.random() < 0.5,
+        "always_accept_requests": False,
+        "creation_time": _date(plan, rng),
+        "is_active": True,
+        "created_by_id": teacher_id,
+    }
+
+
+def _student_row(plan: Plan, index: int, rng: random.Random) -> Row:
+    return {
+        "id": plan.student_base + index + 1,
+        "class_field_id": plan.class_base + (index % plan.classes) + 1,
+        "user_id": plan.profile_base + plan.teachers + index + 1,
+        "new_user_id": plan.user_base + plan.teachers + index + 1,
+    }
+
+
+def _level_metrics_row(plan: Plan, index: int, rng: random.Random) -> Row:
+    # Every student plays the levels in order, so each (student, level) pair
+    # has at most one row.
+    level_index, student_index = divmod(index, plan.students)
+    attempt_count = rng.randrange(1, 11)
+    return {
+        "id": plan.level_metrics_base + index + 1,
+        "level_id": plan.level_ids[level_index],
+        "student_id": plan.student_base + student_index + 1,
+        "top_score": rng.randrange(0, 21),
+        "attempt_count": attempt_count,
+        # In seconds.
+        "time_spent": attempt_count * rng.randrange(10, 600),
+    }
+
+
+# The tables to load, in foreign key order. Tables in the same phase are loaded
+# at the same time.
+PHASES: t.Tuple[t.Tuple[str, ...], ...] = (
+    ("school", "user"),
+    ("profile",),
+    ("teacher",),
+    ("class",),
+    ("student",),
+    ("level_metrics",),
+)
+
+ROW_FACTORIES: t.Dict[str, t.Callable[[Plan, int, random.Random], Row]] = {
+    "school": _school_row,
+    "user": _user_row,
+    "profile": _profile_row,
+    "teacher": _teacher_row,
+    "class": _class_row,
+    "student": _student_row,
+    "level_metrics": _level_metrics_row,
+}
+
+
+def get_models() -> t.Dict[str, t.Type[Model]]:
+    """Get the model of each table to load."""
+    return {
+        "school": apps.get_model("common", "School"),
+        "user": get_user_model(),
+        "profile": apps.get_model("common", "UserProfile"),
+        "teacher": apps.get_model("common", "Teacher"),
+        "class": apps.get_model("common", "Class"),
+        "student": apps.get_model("common", "Student"),
+        "level_metrics": apps.get_model("game", "LevelMetrics"),
+    }
+
+
+def get_row_count(plan: Plan, table: str):
+    """Get the number of rows to generate for a table."""
+    return {
+        "school": plan.schools,
+        "user": plan.users,
+        "profile": plan.users,
+        "teacher": plan.teachers,
+        "class": plan.classes,
+        "student": plan.students,
+        "level_metrics": plan.level_metrics,
+    }[table]
+
+
+def _copy_value(value: t.Any):
+    """Format a value for COPY's text format."""
+    if value is None:
+        return r"\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_chunk(task: t.Tuple[str, Plan, int, int]):
+    """Generate a chunk of a table's rows and COPY them into the database.
+
+    Runs in a worker process, each of which has its own database connection.
+
+    Args:
+        task: The table, the plan and the range of row indexes to generate.
+
+    Returns:
+        The table and the number of rows copied.
+    """
+    table, plan, start, stop = task
+    model = get_models()[table]
+    make_row = ROW_FACTORIES[table]
+    fields = model._meta.concrete_fields
+    # Seed each chunk separately so the dataset is reproducible.
+    rng = random.Random(f"{plan.seed}:{table}:{start}")
+
+    buffer = StringIO()
+    for index in range(start, stop):
+        row = make_row(plan, index, rng)
+        values = []
+        for field in fields:
+            if field.attname in row:
+                value = row[field.attname]
+            elif getattr(field, "auto_now", False) or getattr(
+                field, "auto_now_add", False
+            ):
+                value = plan.now
+            elif field.has_default() or not field.null:
+                value = field.get_default()
+            else:
+                value = None
+
+            values.append(_copy_value(field.get_db_prep_save(value, connection)))
+        buffer.write("\t".join(values))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.execute("SET synchronous_commit TO OFF")
+        cursor.copy_expert(
+            f"COPY {connection.ops.quote_name(model._meta.db_table)}"
+            f" ({columns}) FROM STDIN",
+            buffer,
+        )
+
+    return table, stop - start
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a production-scale synthetic dataset in the local database"
+        " and optionally snapshot it as a template database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--schools", type=int, default=10_000)
+        parser.add_argument("--teachers", type=int, default=100_000)
+        parser.add_argument("--classes-per-teacher", type=int, default=2)
+        parser.add_argument("--students", type=int, default=2_000_000)
+        parser.add_argument("--level-metrics", type=int, default=5_000_000)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=multiprocessing.cpu_count(),
+            help="The number of processes to generate and load rows with.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=50_000,
+            help="The number of rows loaded by each COPY.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--snapshot",
+            metavar="TEMPLATE",
+            help="Copy the database to this template database once loaded.",
+        )
+        parser.add_argument(
+            "--restore",
+            metavar="TEMPLATE",
+            help="Recreate the database from this template database instead"
+            " of generating a dataset.",
+        )
+
+    def handle(self, *args, **options):
+        if getattr(settings, "ENV", "local") != "local":
+            raise CommandError("Load-test data may only be generated locally.")
+        if connection.vendor != "postgresql":
+            raise CommandError("Load-test data requires a Postgres database.")
+
+        if options["restore"]:
+            self.restore(options["restore"])
+            return
+
+        plan = self.get_plan(**options)
+        self.load(plan, workers=options["workers"], chunk_size=options["chunk_size"])
+
+        if options["snapshot"]:
+            self.snapshot(options["snapshot"])
+
+    def get_plan(self, **options):
+        """Make the plan of what to generate."""
+        if min(options["schools"], options["classes_per_teacher"]) < 1:
+            raise CommandError("There must be at least 1 school and class.")
+        if options["students"] and not options["teachers"]:
+            raise CommandError("Students need teachers to be in a class.")
+        if options["level_metrics"] and not options["students"]:
+            raise CommandError("Level metrics need students to play levels.")
+
+        level_ids = tuple(
+            apps.get_model("game", "Level")
+            .objects.filter(default=True)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        if options["level_metrics"] and not level_ids:
+            raise CommandError("There are no default levels. Run migrate.")
+        if options["level_metrics"] > options["students"] * len(level_ids):
+            raise CommandError(
+                "There can only be one level metrics row per student and level."
+            )
+
+        models = get_models()
+
+        def max_id(table: str) -> int:
+            # Use the base manager so inactive rows are not filtered out.
+            # pylint: disable-next=protected-access
+            manager = models[table]._base_manager
+            return manager.aggregate(max_id=Max("id"))["max_id"] or 0
+
+        return Plan(
+            schools=options["schools"],
+            teachers=options["teachers"],
+            classes_per_teacher=options["classes_per_teacher"],
+            students=options["students"],
+            level_metrics=options["level_metrics"],
+            level_ids=level_ids,
+            # Hash once as hashing millions of passwords would take hours.
+            password=make_password("Password1!"),
+            now=timezone.now(),
+            seed=options["seed"],
+            user_base=max_id("user"),
+            profile_base=max_id("profile"),
+            school_base=max_id("school"),
+            teacher_base=max_id("teacher"),
+            class_base=max_id("class"),
+            student_base=max_id("student"),
+            level_metrics_base=max_id("level_metrics"),
+        )
+
+    def load(self, plan: Plan, workers: int, chunk_size: int):
+        """Load the planned dataset with a pool of worker processes."""
+        # Connections must not be shared with the forked workers.
+        connections.close_all()
+
+        start_time = perf_counter()
+        context = multiprocessing.get_context("fork")
+        with context.Pool(processes=workers) as pool:
+            for tables in PHASES:
+                phase_start_time = perf_counter()
+                tasks = [
+                    (table, plan, start, min(start + chunk_size, row_count))
+                    for table in tables
+                    for row_count in [get_row_count(plan, table)]
+                    for start in range(0, row_count, chunk_size)
+                ]
+                copied = {table: 0 for table in tables}
+                for table, row_count in pool.imap_unordered(copy_chunk, tasks):
+                    copied[table] += row_count
+
+                self.stdout.write(
+                    ", ".join(
+                        f"Copied {row_count:,} {table} rows"
+                        for table, row_count in copied.items()
+                    )
+                    + f" in {perf_counter() - phase_start_time:.1f}s."
+                )
+
+        models = list(get_models().values())
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+            for model in models:
+                cursor.execute(
+                    f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}"
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Loaded dataset in {perf_counter() - start_time:.1f}s.")
+        )
+
+    def snapshot(self, template: str):
+        """Copy the database to a template database, replacing any old one."""
+        name = connection.settings_dict["NAME"]
+        self.execute_without_database(
+            f"DROP DATABASE IF EXISTS {connection.ops.quote_name(template)}"
+            " WITH (FORCE)",
+            f"CREATE DATABASE {connection.ops.quote_name(template)}"
+            f" TEMPLATE {connection.ops.quote_name(name)}",
+        )
+        self.stdout.write(self.style.SUCCESS(f'Snapshotted "{name}" as "{template}".'))
+
+    def restore(self, template: str):
+        """Recreate the database from a template database."""
+        name = connection.settings_dict["NAME"]
+        start_time = perf_counter()
+        self.execute_without_database(
+            f"DROP DATABASE IF EXISTS {connection.ops.quote_name(name)}"
+            " WITH (FORCE)",
+            f"CREATE DATABASE {connection.ops.quote_name(name)}"
+            f" TEMPLATE {connection.ops.quote_name(template)}",
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Restored "{name}" from "{template}"'
+                f" in {perf_counter() - start_time:.1f}s."
+            )
+        )
+
+    @staticmethod
+    def execute_without_database(*sqls: str):
+        """Execute SQL while not connected to the service's database.
+
+        Databases cannot be copied or dropped while there are connections to
+        them, so the maintenance database is connected to instead.
+        """
+        connections.close_all()
+        # pylint: disable-next=protected-access
+        with connection._nodb_cursor() as cursor:
+            for sql in sqls:
+                cursor.execute(sql)
@@ -0,0 +1,87 @@
+"""
+Merge the request profiles written by the ProfilingMiddleware per route.
+
+Each merge is written to new files named after the route and the time of the
+merge, so merges with --delete never overwrite the samples of earlier merges.
+The merged files can be merged again to combine them.
+
+Examples:
+    ```
+    python manage.py merge_profiles --delete
+    python manage.py merge_profiles --dir profiles/merged --delete
+    flamegraph.pl profiles/merged/merged/home__*.collapsed > home.svg
+    ```
+"""
+
+import typing as t
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Merge the request profiles per route."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dir",
+            type=Path,
+            default=Path(getattr(settings, "PROFILING_DIR", "profiles")),
+            help="The directory the profiles were written to.",
+        )
+        parser.add_argument(
+            "--output",
+            type=Path,
+            help="The directory to write the merged profiles to."
+            ' Defaults to a "merged" directory in the profiles\' directory.',
+        )
+        parser.add_argument(
+            "--delete",
+            action="store_true",
+            help="Delete the profiles once merged. They will not be included"
+            " the next time the profiles are merged.",
+        )
+
+    def handle(self, *args, **options):
+        directory: Path = options["dir"]
+        output: Path = options["output"] or directory / "merged"
+        if not directory.is_dir():
+            raise CommandError(f'"{directory}" is not a directory.')
+
+        paths: t.Dict[str, t.List[Path]] = defaultdict(list)
+        for path in directory.glob("*__*.collapsed"):
+            route = path.name.rsplit("__", 1)[0]
+            paths[route].append(path)
+
+        if not paths:
+            self.stdout.write(f'There are no profiles in "{directory}".')
+            return
+
+        output.mkdir(parents=True, exist_ok=True)
+        merged_at = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        for route, route_paths in sorted(paths.items()):
+            merged_path = output / f"{route}__{merged_at}.collapsed"
+
+            profile: t.Counter[str] = Counter()
+            for path in route_paths:
+                with open(path, encoding="utf-8") as profile_file:
+                    for line in profile_file:
+                        stack, _, count = line.rstrip("\n").rpartition(" ")
+                        if stack:
+                            profile[stack] += int(count)
+
+            with open(merged_path, "w", encoding="utf-8") as merged_file:
+                for stack, count in sorted(profile.items()):
+                    merged_file.write(f"{stack} {count}\n")
+
+            if options["delete"]:
+                for path in route_paths:
+                    path.unlink()
+
+            self.stdout.write(
+                f"Merged {len(route_paths)} profiles of {route} into"
+                f' "{merged_path}" ({sum(profile.values())} samples).'
+            )
@@ -0,0 +1,30 @@
+"""
+Run background jobs in the foreground, e.g. in a separate process from the web
+workers when JOBS_WORKERS is 0.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cfl.jobs import job_worker_pool
+
+
+class Command(BaseCommand):
+    help = "Run background jobs until interrupted."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=getattr(settings, "JOBS_WORKERS", 0) or 1,
+            help="The number of threads to run jobs with.",
+        )
+
+    def handle(self, *args, **options):
+        workers: int = options["workers"]
+        poll_interval = getattr(settings, "JOBS_POLL_INTERVAL", 1)
+
+        self.stdout.write(f"Running jobs with {workers} threads.")
+        # This thread is one of the workers.
+        job_worker_pool.start(workers=workers - 1, poll_interval=poll_interval)
+        job_worker_pool.run(poll_interval=poll_interval)
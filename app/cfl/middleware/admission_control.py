@@ -0,0 +1,168 @@
+"""Admission control for each worker process.
+
+When a worker is overloaded, requests queue up inside it until they time out at
+the load balancer, so every user sees bad latency. Instead, this tracks how many
+requests are in flight and how long they queued inside Django, and
+rejects requests early with a 503 when either exceeds its limit. Health checks
+are always admitted and logged-in teachers are given extra headroom.
+
+While requests are being rejected, the health check reports the worker as
+unhealthy so the load balancer rebalances instead of piling on.
+"""
+
+import threading
+import typing as t
+from dataclasses import dataclass, field
+from functools import cache
+from time import monotonic
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.urls import reverse
+
+Priority = t.Literal["critical", "high", "normal"]
+
+# The key of the time at which Django started handling a request in its ASGI
+# scope or WSGI environ.
+RECEIVED_AT = "cfl.received_at"
+
+
+@dataclass
+class AdmissionController:
+    """Decides which requests to admit based on the load of this worker."""
+
+    max_in_flight: int
+    max_queue_delay: float
+    # How much higher the limits are for high-priority requests.
+    high_priority_headroom: float = 1.5
+    # How long the worker is considered overloaded after a rejection.
+    overload_window: float = 10
+    # The weight of the latest queueing delay in its moving average.
+    smoothing: float = 0.2
+
+    in_flight: int = 0
+    queue_delay: float = 0
+    rejected: int = 0
+    last_rejected_at: t.Optional[float] = None
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def get_limits(self, priority: Priority):
+        """Get the max requests in flight and queueing delay for a priority."""
+        headroom = self.high_priority_headroom if priority == "high" else 1
+        return self.max_in_flight * headroom, self.max_queue_delay * headroom
+
+    def is_saturated(self, queue_delay: float):
+        """Whether a normal-priority request would be rejected."""
+        max_in_flight, max_queue_delay = self.get_limits("normal")
+        return self.in_flight >= max_in_flight or queue_delay > max_queue_delay
+
+    def admit(self, priority: Priority, queue_delay: float):
+        """Try to admit a request. Admitted requests must be released.
+
+        Args:
+            priority: The priority of the request.
+            queue_delay: How long the request queued in this worker.
+
+        Returns:
+            Whether the request was admitted.
+        """
+        with self._lock:
+            self.queue_delay += self.smoothing * (queue_delay - self.queue_delay)
+
+            max_in_flight, max_queue_delay = self.get_limits(priority)
+            if priority != "critical" and (
+                self.in_flight >= max_in_flight or queue_delay > max_queue_delay
+            ):
+                self.rejected += 1
+                self.last_rejected_at = monotonic()
+                return False
+
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        """Release an admitted request once it has been responded to."""
+        with self._lock:
+            self.in_flight -= 1
+
+    @property
+    def overloaded(self):
+        """Whether requests were rejected recently."""
+        return (
+            self.last_rejected_at is not None
+            and monotonic() - self.last_rejected_at < self.overload_window
+        )
+
+
+@cache
+def get_admission_controller():
+    """Get this worker's admission controller."""
+    return AdmissionController(
+        max_in_flight=getattr(settings, "ADMISSION_CONTROL_MAX_IN_FLIGHT", 64),
+        max_queue_delay=getattr(settings, "ADMISSION_CONTROL_MAX_QUEUE_DELAY", 2),
+    )
+
+
+def stamp_request(scope=None, environ=None, **kwargs):
+    """Record when Django started handling a request.
+
+    Receives the `request_started` signal, which ASGI requests send once their
+    body has been read, so a slow upload does not count as queueing delay.
+    """
+    # ASGI requests keep their scope. WSGI requests' META is their environ.
+    request_data = scope if scope is not None else environ
+    if request_data is not None:
+        request_data[RECEIVED_AT] = monotonic()
+
+
+def get_queue_delay(request: HttpRequest):
+    """Get how long a request queued before reaching the middleware."""
+    received_at = getattr(request, "scope", request.META).get(RECEIVED_AT)
+    return 0 if received_at is None else max(monotonic() - received_at, 0)
+
+
+@cache
+def get_health_check_path():
+    """Get the path of the health check."""
+    return reverse("health-check")
+
+
+class AdmissionControlMiddleware:
+    """Rejects requests early with a 503 when this worker is overloaded.
+
+    Must come after the AuthenticationMiddleware so teachers can be identified.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.retry_after = getattr(settings, "ADMISSION_CONTROL_RETRY_AFTER", 5)
+
+    def get_priority(self, request: HttpRequest, queue_delay: float) -> Priority:
+        """Get the priority of a request."""
+        if request.path == get_health_check_path():
+            return "critical"
+
+        # Only look up the user when it could make a difference.
+        if get_admission_controller().is_saturated(queue_delay):
+            user = getattr(request, "user", None)
+            if user and user.is_authenticated and hasattr(user, "new_teacher"):
+                return "high"
+
+        return "normal"
+
+    def __call__(self, request: HttpRequest):
+        admission_controller = get_admission_controller()
+        queue_delay = get_queue_delay(request)
+        priority = self.get_priority(request, queue_delay)
+        if not admission_controller.admit(priority, queue_delay):
+            return HttpResponse(
+                "The server is overloaded. Please try again later.",
+                content_type="text/plain",
+                status=503,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+
+        try:
+            return self.get_response(request)
+        finally:
+            admission_controller.release()
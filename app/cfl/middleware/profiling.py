@@ -0,0 +1,194 @@
+"""On-demand sampling profiler for live requests.
+
+Profiling is off unless a request triggers it, either with a signed header or by
+being sampled at its route's configured rate. While a request is profiled, a
+background thread samples its stack at a fixed interval, which has a far lower
+overhead than tracing every call. The samples are written in the collapsed
+flame-graph format, which can be merged per route with `manage.py
+merge_profiles` and rendered with tools such as flamegraph.pl or speedscope.
+
+Examples:
+    ```
+    # Create a signed header value.
+    python manage.py shell -c "
+    from cfl.middleware.profiling import sign_profile_request
+    print(sign_profile_request())"
+
+    # Profile a request.
+    curl -H "X-Profile: <signed value>" https://www.codeforlife.education/
+    ```
+"""
+
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import typing as t
+from collections import Counter
+from pathlib import Path
+from time import sleep, time_ns
+from types import FrameType
+
+from django.conf import settings
+from django.core.signing import BadSignature, TimestampSigner
+from django.http import HttpRequest
+from django.urls import Resolver404, resolve
+
+SIGNER_SALT = "cfl.profiling"
+SIGNED_VALUE = "profile"
+
+
+def sign_profile_request():
+    """Get a signed value for the X-Profile header."""
+    return TimestampSigner(salt=SIGNER_SALT).sign(SIGNED_VALUE)
+
+
+def collapse_stack(frame: t.Optional[FrameType]):
+    """Collapse a stack into a line of the collapsed flame-graph format."""
+    names: t.List[str] = []
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "?")
+        names.append(f"{module}:{frame.f_code.co_name}")
+        frame = frame.f_back
+
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """Samples the stacks of the threads being profiled in this process."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.profiles: t.Dict[int, t.Counter[str]] = {}
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._pid: t.Optional[int] = None
+
+    def start(self, thread_id: int):
+        """Start profiling a thread.
+
+        Args:
+            thread_id: The identifier of the thread to profile.
+        """
+        with self._lock:
+            # Threads do not survive forking, so start one in each process.
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(
+                    target=self.run, name="cfl-profiler", daemon=True
+                ).start()
+
+            self.profiles[thread_id] = Counter()
+            self._active.set()
+
+    def stop(self, thread_id: int):
+        """Stop profiling a thread.
+
+        Args:
+            thread_id: The identifier of the profiled thread.
+
+        Returns:
+            The number of times each stack was sampled.
+        """
+        with self._lock:
+            profile = self.profiles.pop(thread_id)
+            if not self.profiles:
+                self._active.clear()
+
+        return profile
+
+    def run(self):
+        """Sample the profiled threads while there are any."""
+        while True:
+            self._active.wait()
+            sleep(self.interval)
+
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            with self._lock:
+                for thread_id, profile in self.profiles.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        profile[collapse_stack(frame)] += 1
+
+
+class ProfilingMiddleware:
+    """Profiles requests which are triggered by a signed X-Profile header or
+    sampled at their route's rate in PROFILING_SAMPLE_RATES.
+
+    Must come first so the whole middleware chain is profiled.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rates: t.Dict[str, float] = getattr(
+            settings, "PROFILING_SAMPLE_RATES", {}
+        )
+        self.signature_max_age: float = getattr(
+            settings, "PROFILING_SIGNATURE_MAX_AGE", 60 * 60
+        )
+        self.directory = Path(getattr(settings, "PROFILING_DIR", "profiles"))
+        self.sampler = StackSampler(
+            interval=getattr(settings, "PROFILING_INTERVAL", 0.01)
+        )
+
+    def is_signed(self, request: HttpRequest):
+        """Whether the request has a valid signed X-Profile header."""
+        value = request.headers.get("X-Profile")
+        if not value:
+            return False
+
+        try:
+            return (
+                TimestampSigner(salt=SIGNER_SALT).unsign(
+                    value, max_age=self.signature_max_age
+                )
+                == SIGNED_VALUE
+            )
+        except BadSignature:
+            return False
+
+    def is_sampled(self, request: HttpRequest):
+        """Whether the request is sampled at its route's rate."""
+        if not self.sample_rates:
+            return False
+
+        try:
+            route = resolve(request.path_info).view_name
+        except Resolver404:
+            return False
+
+        return random.random() < self.sample_rates.get(route, 0)
+
+    def __call__(self, request: HttpRequest):
+        if not (self.is_signed(request) or self.is_sampled(request)):
+            return self.get_response(request)
+
+        thread_id = threading.get_ident()
+        self.sampler.start(thread_id)
+        try:
+            return self.get_response(request)
+        finally:
+            profile = self.sampler.stop(thread_id)
+            try:
+                self.write_profile(request, profile)
+            # pylint: disable-next=broad-exception-caught
+            except Exception:
+                logging.exception("Failed to write profile.")
+
+    def write_profile(self, request: HttpRequest, profile: t.Counter[str]):
+        """Write a request's profile in the collapsed flame-graph format.
+
+        The file is named after the request's route so profiles can be merged
+        per route.
+        """
+        resolver_match = request.resolver_match
+        route = resolver_match.view_name if resolver_match else "unresolved"
+        route = re.sub(r"[^\w.-]+", "_", route)
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{route}__{os.getpid()}_{time_ns()}.collapsed"
+        with open(path, "w", encoding="utf-8") as profile_file:
+            for stack, count in profile.items():
+                profile_file.write(f"{stack} {count}\n")
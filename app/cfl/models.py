@@ -0,0 +1,28 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """A job to run in the background. See cfl.jobs."""
+
+    kind = models.CharField(max_length=64)
+    # Jobs of the same kind with the same batch key can be run together.
+    batch_key = models.CharField(max_length=255, blank=True, default="")
+    payload = models.JSONField()
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(default=timezone.now)
+    failed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["run_after"],
+                condition=models.Q(failed_at__isnull=True),
+                name="cfl_job_pending_idx",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk}"
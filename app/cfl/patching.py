@@ -0,0 +1,19 @@
+"""Replacement of functions in installed packages."""
+
+import sys
+import typing as t
+
+
+def replace_function(original: t.Callable, replacement: t.Callable):
+    """Replace a function in every module which holds it.
+
+    Modules which already imported the function by name are patched too.
+
+    Args:
+        original: The function to replace.
+        replacement: The function to replace it with.
+    """
+    name = original.__name__
+    for module in list(sys.modules.values()):
+        if getattr(module, name, None) is original:
+            setattr(module, name, replacement)
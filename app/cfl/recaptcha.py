@@ -0,0 +1,108 @@
+"""Verification of reCAPTCHA responses with the shared, pooled HTTP client.
+
+django_recaptcha opens a new connection to verify each response. `patch_recaptcha`
+replaces its request function with one which uses the recaptcha integration's
+client. See cfl.http.
+
+reCAPTCHA fields copy the keys from the settings when their forms are defined,
+so `refresh_recaptcha_fields` swaps in rotated keys. See cfl.refresh.
+"""
+
+import sys
+import typing as t
+from email.message import Message
+from io import BytesIO
+from urllib.error import HTTPError
+
+import httpx
+from django.conf import settings
+
+from cfl.http import CircuitOpenError, get_client
+
+# Modules which define forms with reCAPTCHA fields.
+RECAPTCHA_FORMS = (
+    "portal.forms.play",
+    "portal.forms.registration",
+    "portal.forms.teach",
+)
+
+
+def recaptcha_request(params: bytes):
+    """Send a reCAPTCHA response to be verified.
+
+    Args:
+        params: The URL-encoded verification parameters.
+
+    Raises:
+        HTTPError: The response could not be verified, as the original raises.
+
+    Returns:
+        A file-like object of the response's body, as django_recaptcha expects.
+    """
+    domain = getattr(settings, "RECAPTCHA_DOMAIN", "www.google.com")
+    url = f"https://{domain}/recaptcha/api/siteverify"
+    # Failures are raised as HTTPErrors, which django_recaptcha turns into
+    # validation errors.
+    try:
+        response = get_client("recaptcha").request(
+            "POST",
+            url,
+            content=params,
+            headers={
+                "Content-type": "application/x-www-form-urlencoded",
+                "User-agent": "reCAPTCHA Django",
+            },
+        )
+        response.raise_for_status()
+    except httpx.HTTPStatusError as ex:
+        raise HTTPError(
+            url, ex.response.status_code, ex.response.reason_phrase, Message(), None
+        ) from ex
+    except (httpx.HTTPError, CircuitOpenError) as ex:
+        raise HTTPError(url, 503, str(ex), Message(), None) from ex
+
+    return BytesIO(response.content)
+
+
+def patch_recaptcha():
+    """Replace django_recaptcha's request function, unless it uses a proxy."""
+    # pylint: disable-next=import-outside-toplevel
+    from django_recaptcha import client
+
+    if not getattr(settings, "RECAPTCHA_PROXY", None):
+        client.recaptcha_request = recaptcha_request
+
+
+def refresh_recaptcha_fields(
+    previous_private_key: t.Optional[str], previous_public_key: t.Optional[str]
+):
+    """Swap the rotated keys into the reCAPTCHA fields of the forms.
+
+    Forms copy their fields when they're created, so new forms use the new keys.
+    Fields which were given their own keys are left as they are.
+
+    Args:
+        previous_private_key: The private key before it was rotated.
+        previous_public_key: The public key before it was rotated.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from django_recaptcha.fields import ReCaptchaField
+
+    for module_name in RECAPTCHA_FORMS:
+        module = sys.modules.get(module_name)
+        if module is None:
+            continue
+
+        for form in vars(module).values():
+            if not isinstance(form, type):
+                continue
+
+            for field in getattr(form, "base_fields", {}).values():
+                if not isinstance(field, ReCaptchaField):
+                    continue
+
+                if field.private_key == previous_private_key:
+                    field.private_key = settings.RECAPTCHA_PRIVATE_KEY
+                if field.public_key == previous_public_key:
+                    field.public_key = settings.RECAPTCHA_PUBLIC_KEY
+                    field.widget.attrs["data-sitekey"] = field.public_key
@@ -0,0 +1,177 @@
+"""Recycling of Gunicorn workers before their memory grows too large.
+
+Long-lived workers grow in RSS from caches and fragmentation. The arbiter checks
+its workers periodically and recycles a worker once its RSS exceeds a threshold
+or it has served a jittered number of requests. A recycled worker is sent
+SIGTERM, so it stops accepting connections and finishes its in-flight requests
+before exiting. Its replacement is spawned first, so the number of workers
+accepting connections never drops while it exits. At most a bounded
+share of the workers are recycled at once so capacity never drops off a cliff.
+
+Requests are counted by each worker in memory shared with the arbiter, as the
+arbiter cannot see how many requests an ASGI worker has served.
+"""
+
+import ctypes
+import multiprocessing
+import signal
+import typing as t
+from random import randint
+from time import monotonic
+
+import psutil
+
+_worker_recycler: t.Optional["WorkerRecycler"] = None
+# The slot of this worker process in the shared request counts.
+_slot: t.Optional[int] = None
+
+
+class WorkerRecycler:
+    """Decides which workers to recycle. Runs in the Gunicorn arbiter.
+
+    `pre_fork`, `post_fork` and `child_exit` are Gunicorn server hooks.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_rss: int,
+        max_requests: int,
+        max_requests_jitter: int,
+        max_recycling_share: float,
+        check_interval: float = 5,
+    ):
+        """
+        Args:
+            workers: The number of workers.
+            max_rss: The number of MB of RSS after which a worker is recycled.
+                0 disables this trigger.
+            max_requests: The number of requests after which a worker is
+                recycled. 0 disables this trigger.
+            max_requests_jitter: The max number of requests randomly added to
+                each worker's max requests, so workers are not all recycled at
+                the same time.
+            max_recycling_share: The max share of the workers to recycle at
+                once. At least one worker may always be recycled.
+            check_interval: The number of seconds between checks.
+        """
+        self.max_rss = max_rss
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.max_recycling = max(1, int(workers * max_recycling_share))
+        self.check_interval = check_interval
+
+        # Replacements are spawned before recycled workers exit.
+        slots = workers + self.max_recycling
+        self.request_counts = multiprocessing.RawArray(ctypes.c_ulonglong, slots)
+        self._free_slots = list(range(slots))
+        # The workers being recycled by pid, with when their recycling started.
+        self._recycling: t.Dict[int, float] = {}
+        self._checked_at = 0.0
+
+        global _worker_recycler  # pylint: disable=global-statement
+        _worker_recycler = self
+
+    def pre_fork(self, arbiter, worker):
+        """Assign a new worker its request count slot and max requests."""
+        worker.recycling_slot = self._free_slots.pop() if self._free_slots else None
+        if worker.recycling_slot is not None:
+            self.request_counts[worker.recycling_slot] = 0
+
+        worker.recycling_max_requests = (
+            self.max_requests + randint(0, self.max_requests_jitter)
+            if self.max_requests
+            else 0
+        )
+
+    def post_fork(self, arbiter, worker):
+        """Count the requests of the new worker process in its slot."""
+        global _slot  # pylint: disable=global-statement
+        _slot = worker.recycling_slot
+
+    def child_exit(self, arbiter, worker):
+        """Free the slot of an exited worker and log if it was recycled."""
+        if worker.recycling_slot is not None:
+            self._free_slots.append(worker.recycling_slot)
+
+        recycling_started_at = self._recycling.pop(worker.pid, None)
+        if recycling_started_at is not None:
+            # The replacement has taken this worker's place.
+            arbiter.num_workers -= 1
+            arbiter.log.info(
+                "Recycled worker (pid: %s) in %.1fs.",
+                worker.pid,
+                monotonic() - recycling_started_at,
+            )
+
+    def get_recycle_reason(self, worker) -> t.Optional[str]:
+        """Get why a worker should be recycled, if it should be."""
+        if self.max_rss:
+            try:
+                rss = psutil.Process(worker.pid).memory_info().rss // 2**20
+            except psutil.Error:
+                # The worker may have just exited. Skip only this check.
+                rss = None
+
+            if rss is not None and rss > self.max_rss:
+                return f"RSS of {rss}MB exceeds {self.max_rss}MB"
+
+        if worker.recycling_max_requests and worker.recycling_slot is not None:
+            request_count = self.request_counts[worker.recycling_slot]
+            if request_count >= worker.recycling_max_requests:
+                return (
+                    f"served {request_count} requests of"
+                    f" {worker.recycling_max_requests}"
+                )
+
+        return None
+
+    def recycle_workers(self, arbiter):
+        """Recycle the workers which need it, oldest first, while fewer than
+        the max number of workers are being recycled.
+
+        Called on each iteration of the arbiter's main loop.
+        """
+        now = monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+
+        recycled_workers = []
+        workers = sorted(arbiter.WORKERS.values(), key=lambda worker: worker.age)
+        for worker in workers:
+            if len(self._recycling) >= self.max_recycling:
+                break
+            if worker.pid in self._recycling:
+                continue
+
+            reason = self.get_recycle_reason(worker)
+            if reason is not None:
+                arbiter.log.info("Recycling worker (pid: %s): %s.", worker.pid, reason)
+                self._recycling[worker.pid] = now
+                recycled_workers.append(worker)
+
+        if not recycled_workers:
+            return
+
+        # Spawn the replacements before the recycled workers stop accepting
+        # connections. The arbiter only spawns workers while it has fewer than
+        # num_workers, so it's raised until the recycled workers exit.
+        arbiter.num_workers += len(recycled_workers)
+        arbiter.spawn_workers()
+
+        for worker in recycled_workers:
+            arbiter.kill_worker(worker.pid, signal.SIGTERM)
+            # The arbiter forgets a worker which had already exited without
+            # calling child_exit.
+            if worker.pid not in arbiter.WORKERS:
+                self.child_exit(arbiter, worker)
+
+
+def count_request(**kwargs):
+    """Count a request served by this worker process.
+
+    Receives the `request_finished` signal.
+    """
+    if _worker_recycler is not None and _slot is not None:
+        _worker_recycler.request_counts[_slot] += 1
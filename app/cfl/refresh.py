@@ -0,0 +1,247 @@
+"""Hot-reloading of the secrets and database credentials.
+
+The secrets and the database credentials are read from S3 when the settings are
+imported. So that rotated values are picked up without restarting the workers,
+each worker polls the S3 objects in a background thread and, when an object's
+ETag changes, swaps in the new values.
+
+Examples:
+    ```
+    # settings.py
+    from cfl.refresh import refresher
+
+    def refresh_secrets(body: bytes):
+        ...
+
+    refresher.watch("my-bucket", "my-folder/secure/.env.secrets", refresh_secrets)
+    ```
+"""
+
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import typing as t
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connections
+
+if t.TYPE_CHECKING:
+    from mypy_boto3_s3.client import S3Client
+
+# Modules which copy settings into their own attributes when they're imported.
+SETTINGS_COPIES = ("common.app_settings",)
+
+
+@dataclass
+class S3ObjectWatcher:
+    """Watches an S3 object for changes to its ETag."""
+
+    bucket: str
+    key: str
+    on_change: t.Callable[[bytes], None]
+    etag: t.Optional[str] = None
+
+    def poll(self, s3: "S3Client"):
+        """Get the object if it has changed since it was last polled.
+
+        Args:
+            s3: The S3 client to get the object with.
+
+        Returns:
+            Whether the object changed.
+        """
+        # pylint: disable-next=import-outside-toplevel
+        from botocore.exceptions import ClientError
+
+        try:
+            s3_object = s3.get_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                **({"IfNoneMatch": self.etag} if self.etag else {}),
+            )
+        except ClientError as error:
+            if error.response["ResponseMetadata"]["HTTPStatusCode"] == 304:
+                return False
+            raise
+
+        self.on_change(s3_object["Body"].read())
+        # Only remember the ETag once handled so failed changes are retried.
+        self.etag = s3_object["ETag"]
+        return True
+
+
+class Refresher:
+    """Polls S3 objects in a background thread of each worker process."""
+
+    def __init__(self):
+        self.watchers: t.List[S3ObjectWatcher] = []
+        self._lock = threading.Lock()
+        self._pid: t.Optional[int] = None
+
+    def watch(self, bucket: str, key: str, on_change: t.Callable[[bytes], None]):
+        """Watch an S3 object for changes.
+
+        The callback is also called the first time the object is polled, so it
+        should do nothing if the values have not changed.
+
+        Args:
+            bucket: The bucket of the object.
+            key: The key of the object.
+            on_change: Called with the object's body when it changes.
+        """
+        self.watchers.append(S3ObjectWatcher(bucket, key, on_change))
+
+    def start(self, interval: float):
+        """Start polling in this process, if not already started.
+
+        Threads do not survive forking, so this is safe to call in each request
+        and starts a thread once per worker process.
+
+        Args:
+            interval: The number of seconds between polls. 0 disables polling.
+        """
+        if self._pid == os.getpid() or not self.watchers or interval <= 0:
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+
+        threading.Thread(
+            target=self.run,
+            args=(interval,),
+            name="cfl-refresher",
+            daemon=True,
+        ).start()
+
+    def run(self, interval: float):
+        """Poll the watched objects forever."""
+        # pylint: disable-next=import-outside-toplevel
+        import boto3
+
+        s3: "S3Client" = boto3.client("s3")
+        while True:
+            # Jitter the interval so the workers don't all poll at once.
+            time.sleep(interval * random.uniform(0.9, 1.1))
+            for watcher in self.watchers:
+                try:
+                    watcher.poll(s3)
+                # pylint: disable-next=broad-exception-caught
+                except Exception:
+                    logging.exception(
+                        'Failed to refresh "%s/%s".', watcher.bucket, watcher.key
+                    )
+
+
+refresher = Refresher()
+
+
+def refresh_settings(values: t.Dict[str, t.Any]):
+    """Swap in new values for settings.
+
+    If the secret key changes, the previous one is kept as the only fallback so
+    that existing sessions and signatures remain valid until the next rotation.
+    If the reCAPTCHA keys change, they're also swapped into the forms' fields.
+
+    Args:
+        values: The new values of the settings.
+    """
+    changes = {
+        name: value
+        for name, value in values.items()
+        if getattr(settings, name, None) != value
+    }
+    if not changes:
+        return
+
+    if "SECRET_KEY" in changes:
+        # Keys rotated out before the previous one must stop verifying.
+        changes["SECRET_KEY_FALLBACKS"] = [settings.SECRET_KEY]
+
+    previous_values = {name: getattr(settings, name, None) for name in changes}
+    for name, value in changes.items():
+        setattr(settings, name, value)
+        for module_name in SETTINGS_COPIES:
+            module = sys.modules.get(module_name)
+            if module and hasattr(module, name):
+                setattr(module, name, value)
+
+    if changes.keys() & {"RECAPTCHA_PRIVATE_KEY", "RECAPTCHA_PUBLIC_KEY"}:
+        # pylint: disable-next=import-outside-toplevel
+        from cfl.recaptcha import refresh_recaptcha_fields
+
+        refresh_recaptcha_fields(
+            previous_private_key=previous_values.get(
+                "RECAPTCHA_PRIVATE_KEY", settings.RECAPTCHA_PRIVATE_KEY
+            ),
+            previous_public_key=previous_values.get(
+                "RECAPTCHA_PUBLIC_KEY", settings.RECAPTCHA_PUBLIC_KEY
+            ),
+        )
+
+    logging.info("Refreshed settings: %s.", ", ".join(sorted(changes)))
+
+
+# The number of times each database's credentials have been refreshed.
+_credentials_generations: t.Dict[str, int] = {}
+
+
+def refresh_database_credentials(alias: str, credentials: t.Dict[str, t.Any]):
+    """Swap in new credentials for a database.
+
+    New connections use the new credentials straight away. Existing connections
+    are closed once their request finishes. See `recycle_connections`.
+
+    Args:
+        alias: The alias of the database.
+        credentials: The new NAME, USER, PASSWORD, HOST and PORT.
+    """
+    # The connections share this dict with the settings.
+    settings_dict = settings.DATABASES[alias]
+    if all(settings_dict.get(key) == value for key, value in credentials.items()):
+        return
+
+    # Update in a single call so connections never see a partial update.
+    settings_dict.update(credentials)
+    _credentials_generations[alias] = _credentials_generations.get(alias, 0) + 1
+
+    logging.info('Refreshed credentials of database "%s".', alias)
+
+
+def stamp_connection(connection, **kwargs):
+    """Record which credentials a new connection was made with.
+
+    Receives the `connection_created` signal.
+    """
+    connection.credentials_generation = _credentials_generations.get(
+        connection.alias, 0
+    )
+
+
+def recycle_connections(**kwargs):
+    """Close connections made with credentials which have since been refreshed.
+
+    Receives the `request_finished` signal, so in-flight requests continue on
+    their existing connections. Connections in a transaction are left open.
+    """
+    for connection in connections.all(initialized_only=True):
+        if (
+            connection.connection is not None
+            and not connection.in_atomic_block
+            and getattr(connection, "credentials_generation", 0)
+            != _credentials_generations.get(connection.alias, 0)
+        ):
+            connection.close()
+
+
+def start_refresher(**kwargs):
+    """Start the refresher in this process.
+
+    Receives the `request_started` signal.
+    """
+    refresher.start(interval=getattr(settings, "SECRETS_REFRESH_INTERVAL", 0))
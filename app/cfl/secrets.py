@@ -22,6 +22,32 @@ class Secrets(SimpleNamespace):
         except AttributeError:
             return None
 
+    def refresh(self, values: t.Mapping[str, t.Optional[str]]):
+        """Swap in new values for the secrets, e.g. after they were rotated.
+
+        Args:
+            values: The new secrets.
+        """
+        secrets = super().__getattribute__("__dict__")
+        stale_names = secrets.keys() - values.keys()
+        # Update in a single call so readers never see a partial update.
+        secrets.update(values)
+        for name in stale_names:
+            secrets.pop(name, None)
+
+
+def get_secrets_object_key():
+    """Get the key of the secrets' object in the app's S3 bucket."""
+    return f"{os.environ['aws_s3_app_folder']}/secure/.env.secrets"
+
+
+def read_secrets(body: bytes):
+    """Read the secrets from the body of the secrets' object."""
+    # pylint: disable-next=import-outside-toplevel
+    from dotenv import dotenv_values
+
+    return dotenv_values(stream=StringIO(body.decode("utf-8")))
+
 
 def set_up_settings(service_base_dir: Path, service_name: str):
     """Set up the settings for the service.
@@ -101,11 +127,9 @@ def set_up_settings(service_base_dir: Path, service_name: str):
         s3: "S3Client" = boto3.client("s3")
         secrets_object = s3.get_object(
             Bucket=os.environ["aws_s3_app_bucket"],
-            Key=f"{os.environ['aws_s3_app_folder']}/secure/.env.secrets",
+            Key=get_secrets_object_key(),
         )
 
-        secrets = dotenv_values(
-            stream=StringIO(secrets_object["Body"].read().decode("utf-8"))
-        )
+        secrets = read_secrets(secrets_object["Body"].read())
 
     return Secrets(**secrets)
@@ -0,0 +1,178 @@
+"""Tests for cfl.http, against a local stub server."""
+
+import asyncio
+import threading
+import typing as t
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep
+from unittest import TestCase
+
+import httpx
+
+from cfl.http import CircuitOpenError, Integration, IntegrationClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Responds to /ok with 200, /error with 500 and /slow after a second."""
+
+    protocol_version = "HTTP/1.1"
+    server: "StubServer"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Respond to a request and record the connection it came on."""
+        self.server.client_ports.append(self.client_address[1])
+
+        if self.path == "/slow":
+            sleep(1)
+
+        status = 500 if self.path == "/error" else 200
+        body = self.path.encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    """A local HTTP server which records the ports of its clients."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.client_ports: t.List[int] = []
+
+    @property
+    def url(self):
+        """The base URL of the server."""
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class TestIntegrationClient(TestCase):
+    """Tests for IntegrationClient."""
+
+    def setUp(self):
+        self.server = StubServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def get_client(self, **kwargs):
+        """Get a client for a stub integration."""
+        client = IntegrationClient(Integration(name="stub", **kwargs))
+        self.addCleanup(lambda: client.client.close())
+        return client
+
+    def test_request__reuses_connection(self):
+        """Requests reuse a kept-alive connection."""
+        client = self.get_client()
+
+        for _ in range(3):
+            client.request("GET", f"{self.server.url}/ok")
+
+        self.assertEqual(len(self.server.client_ports), 3)
+        self.assertEqual(len(set(self.server.client_ports)), 1)
+
+    def test_request__timeout(self):
+        """Each integration has its own timeout."""
+        impatient_client = self.get_client(timeout=0.2)
+        patient_client = self.get_client(timeout=5)
+
+        with self.assertRaises(httpx.TimeoutException):
+            impatient_client.request("GET", f"{self.server.url}/slow")
+        response = patient_client.request("GET", f"{self.server.url}/slow")
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_request__circuit_opens_on_server_errors(self):
+        """The circuit opens after the failure threshold of 5xx responses."""
+        client = self.get_client(failure_threshold=3)
+
+        for _ in range(2):
+            client.request("GET", f"{self.server.url}/error")
+        self.assertEqual(client.circuit_breaker.state, "closed")
+        client.request("GET", f"{self.server.url}/error")
+        self.assertEqual(client.circuit_breaker.state, "open")
+
+        with self.assertRaises(CircuitOpenError):
+            client.request("GET", f"{self.server.url}/ok")
+        self.assertEqual(len(self.server.client_ports), 3)
+        self.assertEqual(client.metrics.errors, 3)
+        self.assertEqual(client.metrics.rejected, 1)
+
+    def test_request__circuit_opens_on_transport_errors(self):
+        """The circuit opens after the failure threshold of transport errors."""
+        client = self.get_client(failure_threshold=2, timeout=0.2)
+
+        for _ in range(2):
+            with self.assertRaises(httpx.TimeoutException):
+                client.request("GET", f"{self.server.url}/slow")
+
+        self.assertEqual(client.circuit_breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            client.request("GET", f"{self.server.url}/ok")
+
+    def test_request__half_open_probe(self):
+        """After the reset timeout, a single probe is let through and closes
+        the circuit if it succeeds."""
+        client = self.get_client(failure_threshold=1, reset_timeout=0.1)
+        client.request("GET", f"{self.server.url}/error")
+        self.assertEqual(client.circuit_breaker.state, "open")
+        sleep(0.2)
+
+        # Only one of the concurrent callers may probe.
+        self.assertTrue(client.circuit_breaker.allow())
+        self.assertEqual(client.circuit_breaker.state, "halfOpen")
+        self.assertFalse(client.circuit_breaker.allow())
+        self.assertFalse(client.circuit_breaker.allow())
+
+        client.circuit_breaker.record_success()
+        self.assertEqual(client.circuit_breaker.state, "closed")
+        response = client.request("GET", f"{self.server.url}/ok")
+        self.assertEqual(response.status_code, 200)
+
+    def test_request__half_open_probe_fails(self):
+        """A failed probe opens the circuit again."""
+        client = self.get_client(failure_threshold=1, reset_timeout=0.1)
+        client.request("GET", f"{self.server.url}/error")
+        sleep(0.2)
+
+        client.request("GET", f"{self.server.url}/error")
+
+        self.assertEqual(client.circuit_breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            client.request("GET", f"{self.server.url}/ok")
+
+    def test_arequest__parity(self):
+        """The sync and async interfaces behave the same."""
+        sync_client = self.get_client(failure_threshold=2)
+        async_client = self.get_client(failure_threshold=2)
+
+        paths = ["/ok", "/error"]
+
+        async def arequest_all():
+            try:
+                return [
+                    await async_client.arequest("GET", f"{self.server.url}{path}")
+                    for path in paths
+                ]
+            finally:
+                await async_client.async_client.aclose()
+
+        sync_responses = [
+            sync_client.request("GET", f"{self.server.url}{path}") for path in paths
+        ]
+        async_responses = asyncio.run(arequest_all())
+
+        for sync_response, async_response in zip(sync_responses, async_responses):
+            self.assertEqual(sync_response.status_code, async_response.status_code)
+            self.assertEqual(sync_response.content, async_response.content)
+
+        self.assertEqual(sync_client.metrics.requests, async_client.metrics.requests)
+        self.assertEqual(sync_client.metrics.errors, async_client.metrics.errors)
+        self.assertEqual(
+            sync_client.circuit_breaker.state, async_client.circuit_breaker.state
+        )
@@ -6,7 +6,8 @@ from pathlib import Path
 
 import boto3
 from cfl.otp import AWS_S3_APP_BUCKET, RDS_DB_DATA_PATH
-from cfl.secrets import set_up_settings
+from cfl.refresh import refresh_database_credentials, refresh_settings, refresher
+from cfl.secrets import get_secrets_object_key, read_secrets, set_up_settings
 
 Env = t.Literal["local", "development", "staging", "production"]
 ENV = t.cast(Env, os.getenv("ENV", "local"))
@@ -44,6 +45,7 @@ DOTDIGITAL_AUTH = secrets.DOTDIGITAL_AUTH
 # Application definition
 
 INSTALLED_APPS = (
+    "cfl",
     "deploy",
     "game",
     "pipeline",
@@ -71,12 +73,14 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE = [
+    "cfl.middleware.profiling.ProfilingMiddleware",
     "deploy.middleware.admin_access.AdminAccessMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.locale.LocaleMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "cfl.middleware.admission_control.AdmissionControlMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "deploy.middleware.exceptionlogging.ExceptionLoggingMiddleware",
@@ -89,6 +93,27 @@ MIDDLEWARE = [
     "deploy.middleware.maintenance.MaintenanceMiddleware",
 ]
 
+# Admission control.
+
+ADMISSION_CONTROL_MAX_IN_FLIGHT = int(
+    os.getenv("ADMISSION_CONTROL_MAX_IN_FLIGHT", "64")
+)
+ADMISSION_CONTROL_MAX_QUEUE_DELAY = float(  # seconds
+    os.getenv("ADMISSION_CONTROL_MAX_QUEUE_DELAY", "2")
+)
+ADMISSION_CONTROL_RETRY_AFTER = int(  # seconds
+    os.getenv("ADMISSION_CONTROL_RETRY_AFTER", "5")
+)
+
+# Profiling. Requests are only profiled if they have a signed X-Profile header
+# or are sampled at their route's rate. The rates are keyed by view name.
+
+PROFILING_DIR = Path(os.getenv("PROFILING_DIR", "/tmp/profiles"))
+PROFILING_SAMPLE_RATES: t.Dict[str, float] = json.loads(
+    os.getenv("PROFILING_SAMPLE_RATES", "{}")
+)
+PROFILING_INTERVAL = float(os.getenv("PROFILING_INTERVAL", "0.01"))  # seconds
+
 AUTHENTICATION_BACKENDS = [
     "django.contrib.auth.backends.ModelBackend",
     "portal.backends.StudentLoginBackend",
@@ -174,13 +199,29 @@ SITE_ID = 1
 ALLOWED_HOSTS = ["*"] if ENV == "local" else [".appspot.com", ".codeforlife.education"]
 
 
+def get_db_credentials(db_data: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+    """Get the database credentials from the dbdata object."""
+    if not db_data or db_data["DBEngine"] != "postgres":
+        raise ConnectionAbortedError("Invalid database data.")
+
+    return {
+        "NAME": t.cast(str, db_data["Database"]),
+        "USER": t.cast(str, db_data["user"]),
+        "PASSWORD": t.cast(str, db_data["password"]),
+        "HOST": t.cast(str, db_data["Endpoint"]),
+        "PORT": t.cast(int, db_data["Port"]),
+    }
+
+
 def get_databases():
     if ENV == "local":
-        name = os.getenv("DB_NAME", "codeforlife")
-        user = os.getenv("DB_USER", "root")
-        password = os.getenv("DB_PASSWORD", "password")
-        host = os.getenv("DB_HOST", "localhost")
-        port = int(os.getenv("DB_PORT", "5432"))
+        credentials = {
+            "NAME": os.getenv("DB_NAME", "codeforlife"),
+            "USER": os.getenv("DB_USER", "root"),
+            "PASSWORD": os.getenv("DB_PASSWORD", "password"),
+            "HOST": os.getenv("DB_HOST", "localhost"),
+            "PORT": int(os.getenv("DB_PORT", "5432")),
+        }
     else:
         # Get the dbdata object.
         s3: "S3Client" = boto3.client("s3")
@@ -189,24 +230,14 @@ def get_databases():
         )
 
         # Load the object as a JSON dict.
-        db_data = json.loads(db_data_object["Body"].read().decode("utf-8"))
-        if not db_data or db_data["DBEngine"] != "postgres":
-            raise ConnectionAbortedError("Invalid database data.")
-
-        name = t.cast(str, db_data["Database"])
-        user = t.cast(str, db_data["user"])
-        password = t.cast(str, db_data["password"])
-        host = t.cast(str, db_data["Endpoint"])
-        port = t.cast(int, db_data["Port"])
+        credentials = get_db_credentials(
+            json.loads(db_data_object["Body"].read().decode("utf-8"))
+        )
 
     return {
         "default": {
             "ENGINE": "django.db.backends.postgresql",
-            "NAME": name,
-            "USER": user,
-            "PASSWORD": password,
-            "HOST": host,
-            "PORT": port,
+            **credentials,
             "ATOMIC_REQUESTS": True,
         }
     }
@@ -214,6 +245,85 @@ def get_databases():
 
 DATABASES = get_databases()
 
+# Hot-reloading of the secrets and database credentials.
+# https://docs.aws.amazon.com/AmazonS3/latest/userguide/conditional-requests.html
+
+SECRETS_REFRESH_INTERVAL = float(os.getenv("SECRETS_REFRESH_INTERVAL", "300"))
+
+
+def refresh_secrets(body: bytes):
+    """Swap in rotated secrets and re-read the settings which are set from them
+    above.
+    """
+    secrets.refresh(read_secrets(body))
+    refresh_settings(
+        {
+            "SECRET_KEY": secrets.DJANGO_SECRET,
+            "RECAPTCHA_PRIVATE_KEY": secrets.RECAPTCHA_PRIVATE_KEY,
+            "RECAPTCHA_PUBLIC_KEY": secrets.RECAPTCHA_PUBLIC_KEY,
+            "DOTMAILER_CREATE_CONTACT_URL": secrets.DOTMAILER_CREATE_CONTACT_URL,
+            "DOTMAILER_MAIN_ADDRESS_BOOK_URL": secrets.DOTMAILER_MAIN_ADDRESS_BOOK_URL,
+            "DOTMAILER_TEACHER_ADDRESS_BOOK_URL": (
+                secrets.DOTMAILER_TEACHER_ADDRESS_BOOK_URL
+            ),
+            "DOTMAILER_STUDENT_ADDRESS_BOOK_URL": (
+                secrets.DOTMAILER_STUDENT_ADDRESS_BOOK_URL
+            ),
+            "DOTMAILER_NO_ACCOUNT_ADDRESS_BOOK_URL": (
+                secrets.DOTMAILER_NO_ACCOUNT_ADDRESS_BOOK_URL
+            ),
+            "DOTMAILER_GET_USER_BY_EMAIL_URL": secrets.DOTMAILER_GET_USER_BY_EMAIL_URL,
+            "DOTMAILER_DELETE_USER_BY_ID_URL": secrets.DOTMAILER_DELETE_USER_BY_ID_URL,
+            "DOTMAILER_PUT_CONSENT_DATA_URL": secrets.DOTMAILER_PUT_CONSENT_DATA_URL,
+            "DOTMAILER_SEND_CAMPAIGN_URL": secrets.DOTMAILER_SEND_CAMPAIGN_URL,
+            "DOTMAILER_THANKS_FOR_STAYING_CAMPAIGN_ID": (
+                secrets.DOTMAILER_THANKS_FOR_STAYING_CAMPAIGN_ID
+            ),
+            "DOTMAILER_USER": secrets.DOTMAILER_USER,
+            "DOTMAILER_PASSWORD": secrets.DOTMAILER_PASSWORD,
+            "DOTMAILER_DEFAULT_PREFERENCES": json.loads(
+                secrets.DOTMAILER_DEFAULT_PREFERENCES or "[]"
+            ),
+            "DOTDIGITAL_AUTH": secrets.DOTDIGITAL_AUTH,
+            "SOCIAL_AUTH_PANDASSO_SECRET": secrets.PANDASSO_SECRET,
+            "PANDASSO_URL": secrets.PANDASSO_URL,
+        }
+    )
+
+
+def refresh_databases(body: bytes):
+    """Swap in rotated database credentials."""
+    refresh_database_credentials(
+        "default", get_db_credentials(json.loads(body.decode("utf-8")))
+    )
+
+
+if ENV != "local":
+    refresher.watch(
+        os.environ["aws_s3_app_bucket"], get_secrets_object_key(), refresh_secrets
+    )
+    refresher.watch(t.cast(str, AWS_S3_APP_BUCKET), RDS_DB_DATA_PATH, refresh_databases)
+
+# Outbound HTTP integrations. Each worker has a pooled client per integration.
+# See cfl.http.Integration for the options.
+
+HTTP_INTEGRATIONS: t.Dict[str, t.Dict[str, t.Any]] = {
+    "dotdigital": {"timeout": 30},
+    "dotmailer": {"timeout": 30},
+    "recaptcha": {"timeout": 10},
+}
+
+# Background jobs. Each worker process runs jobs with JOBS_WORKERS threads.
+
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "1"))  # seconds
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "8"))
+# How long a claimed job is leased to the thread running it.
+JOBS_LEASE = float(os.getenv("JOBS_LEASE", "300"))  # seconds
+# When the queue is reported as unhealthy.
+JOBS_MAX_PENDING = int(os.getenv("JOBS_MAX_PENDING", "1000"))
+JOBS_MAX_PENDING_AGE = float(os.getenv("JOBS_MAX_PENDING_AGE", "600"))  # seconds
+
 EMAIL_ADDRESS = "no-reply@codeforlife.education"
 
 LOCALE_PATHS = ("conf/locale",)
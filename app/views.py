@@ -3,7 +3,12 @@ import logging
 import typing as t
 from dataclasses import dataclass
 from datetime import datetime
+from functools import wraps
 
+from cfl.drain import is_draining
+from cfl.http import get_clients
+from cfl.jobs import get_queue_stats
+from cfl.middleware.admission_control import get_admission_controller
 from cfl.permissions import AllowAny
 from django.apps import apps
 from django.conf import settings
@@ -48,15 +53,89 @@ class HealthCheckView(APIView):
     startup_timestamp = datetime.now().isoformat()
     cache_timeout: float = 30
 
+    def get_admission_control_detail(self):
+        """Report the load of this worker and whether it's shedding requests."""
+        admission_controller = get_admission_controller()
+
+        return HealthCheck.Detail(
+            name="admissionControl",
+            description=(
+                f"{admission_controller.in_flight} requests in flight."
+                f" {admission_controller.queue_delay:.3f}s average queueing"
+                f" delay. {admission_controller.rejected} requests rejected."
+            ),
+            health=("unhealthy" if admission_controller.overloaded else "healthy"),
+        )
+
+    def get_job_queue_detail(self):
+        """Report the depth and latency of the background job queue."""
+        queue_stats = get_queue_stats()
+
+        return HealthCheck.Detail(
+            name="jobQueue",
+            description=(
+                f"{queue_stats.pending} jobs pending. The oldest has been"
+                f" pending for {queue_stats.oldest_pending_age:.0f}s."
+                f" {queue_stats.failed} jobs failed."
+            ),
+            health=(
+                "unhealthy"
+                if queue_stats.pending > settings.JOBS_MAX_PENDING
+                or queue_stats.oldest_pending_age > settings.JOBS_MAX_PENDING_AGE
+                else "healthy"
+            ),
+        )
+
+    def get_integration_details(self):
+        """Report the latency and errors of each outbound integration."""
+        details: t.List[HealthCheck.Detail] = []
+        for client in get_clients():
+            metrics = client.metrics
+            circuit_state = client.circuit_breaker.state
+            details.append(
+                HealthCheck.Detail(
+                    name=f"{client.integration.name}Integration",
+                    description=(
+                        f"{metrics.requests} requests."
+                        f" {metrics.average_latency:.3f}s average latency."
+                        f" {metrics.errors} errors. Circuit {circuit_state}."
+                    ),
+                    health="healthy" if circuit_state == "closed" else "unhealthy",
+                )
+            )
+
+        return details
+
     def get_health_check(self, request: Request) -> HealthCheck:
         """Check the health of the current service."""
         try:
+            if is_draining():
+                return HealthCheck(
+                    health_status="shuttingDown",
+                    additional_info="Draining.",
+                )
+
             if not apps.ready or not apps.apps_ready or not apps.models_ready:
                 return HealthCheck(
                     health_status="startingUp",
                     additional_info="Apps not ready.",
                 )
 
+            admission_control_detail = self.get_admission_control_detail()
+            # The job queue and integrations are shared by all workers, so their
+            # health is reported but does not take this worker out of rotation.
+            details = [
+                admission_control_detail,
+                self.get_job_queue_detail(),
+                *self.get_integration_details(),
+            ]
+            if admission_control_detail.health != "healthy":
+                return HealthCheck(
+                    health_status="unhealthy",
+                    additional_info="Overloaded.",
+                    details=details,
+                )
+
             host = request.get_host()
             if not Site.objects.filter(domain=host).exists():
                 # TODO: figure out how to dynamically get and set site.
@@ -69,6 +148,7 @@ class HealthCheckView(APIView):
             return HealthCheck(
                 health_status="healthy",
                 additional_info="All healthy.",
+                details=details,
             )
         # pylint: disable-next=broad-exception-caught
         except Exception as ex:
@@ -126,4 +206,16 @@ class HealthCheckView(APIView):
 
     @classmethod
     def as_view(cls, **initkwargs):
-        return cache_page(cls.cache_timeout)(super().as_view(**initkwargs))
+        view = super().as_view(**initkwargs)
+        cached_view = cache_page(cls.cache_timeout)(view)
+
+        @wraps(view)
+        def health_check_view(request, *args, **kwargs):
+            # Report draining or overloading straight away instead of a cached
+            # health.
+            if is_draining() or get_admission_controller().overloaded:
+                return view(request, *args, **kwargs)
+
+            return cached_view(request, *args, **kwargs)
+
+        return health_check_view